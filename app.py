@@ -19,11 +19,20 @@ warnings.filterwarnings("ignore")
 from modules.logger import get_logger, get_log_entries, clear_logs
 log = get_logger("thz")
 
-from modules.data_loader    import DataLoader
+from modules.data_loader    import DataLoader, CATALOG_ORIGIN
 from modules.fano_fitter    import FanoFitter
+from modules.fit_cache      import shared_fit_cache
 from modules.bcs_analyzer   import BCSAnalyzer
 from modules.dielectric_calc import DielectricCalculator
 from modules.session_manager import SessionManager
+from modules.digest         import content_digest
+from modules.spectrum_stack import SpectrumStack
+from modules.mode_grouping  import (DipFinder, cluster_by_frequency, dip_table,
+                                    group_stats, top_groups, track_modes)
+from modules.mode_pipeline  import fit_all_modes
+from modules.peak_metrics   import roi_preview
+from modules.scan_catalog   import shared_catalog
+from modules.averaging      import AVG_METHODS, average_incremental, group_by_temperature
 from modules.science_plot   import (apply_nature_style, apply_plotly_style,
                                     temp_cmap, format_ax, panel_label,
                                     SINGLE_COL, DOUBLE_COL, TALL_DOUBLE, WONG7)
@@ -216,8 +225,72 @@ def clear_fano_cache():
     """Clear downstream Fano fitting results when raw data processing changes."""
     st.session_state.df = None
     st.session_state.results = {}
+    st.session_state['fit_stats'] = None
     st.session_state['_files_changed'] = True
 
+def spectrum_stack(records, key='files'):
+    """Temperature × frequency matrix of ``records``, rebuilt only when they change."""
+    stacks = st.session_state.setdefault('_stacks', {})
+    stack = stacks.get(key)
+    if stack is None or not stack.matches(records):
+        stack = SpectrumStack.build(records)
+        stacks[key] = stack
+        log.info(f"Built {stack!r}")
+    return stack
+
+def apply_exclusions(raw_files):
+    """Re-average after the excluded-scan set changed.
+
+    Only temperature groups whose membership changed are recomputed, and
+    only their fit results are dropped — and refitted straight away when
+    fits already exist. Every other group's average and Fano result stays
+    valid. Returns the filenames of the recomputed averages.
+    """
+    excluded = st.session_state.get('excluded_scans', set())
+    kept = [d for d in raw_files if d['filename'] not in excluded]
+    avg, grp, memo, recomputed = average_incremental(
+        kept, st.session_state.get('file_digests', {}),
+        st.session_state.get('_avg_memo', {}), method=avg_method)
+    st.session_state.averaged_files = avg
+    st.session_state.avg_group_info = grp
+    st.session_state['_avg_memo'] = memo
+    st.session_state['_avg_method'] = avg_method
+    if not use_avg or not recomputed:
+        return recomputed
+
+    names = {d['filename'] for d in avg}
+    stale = set(recomputed)
+    old = st.session_state.results
+    results = {k: v for k, v in old.items() if k in names and k not in stale}
+    if old:
+        fitter = FanoFitter(smooth_window=smooth_w, remove_outliers=rm_bad,
+                           cache=shared_fit_cache())
+        fitter.prepare([fitter.roi_slice(d['freq'], d['amp_db' if use_db else 'amp'],
+                                         st.session_state.roi)
+                        for d in avg if d['filename'] in stale])
+        for d in avg:
+            if d['filename'] not in stale:
+                continue
+            if use_db:
+                d = d.with_amp('amp_db')
+            try:
+                results[d['filename']] = fitter.fit(
+                    d['freq'], d['amp'], st.session_state.roi,
+                    d['temperature'], d['filename'])
+            except Exception as e:
+                log.warning(f"  ✗ {d['filename']}: {e}")
+                results[d['filename']] = None
+    st.session_state.results = results
+    ok = [r for r in results.values() if r]
+    st.session_state.df = pd.DataFrame(ok) if ok else None
+    return recomputed
+
+def force_reload():
+    """Re-ingest every upload on the next run (e.g. storage dtype changed)."""
+    st.session_state.file_digests = {}
+    st.session_state['_avg_memo'] = {}
+    clear_fano_cache()
+
 # ══════════════════════════════════════════════════════════════
 # SIDEBAR
 # ══════════════════════════════════════════════════════════════
@@ -225,10 +298,11 @@ with st.sidebar:
     st.markdown('<div class="sidebar-section">📁 Data Input · 数据输入</div>',
                 unsafe_allow_html=True)
     uploaded = st.file_uploader(
-        "Upload THz data files (.txt)",
-        type=["txt"], accept_multiple_files=True,
-        help="Filename or header must contain temperature, e.g. '300K'\\n"
-             "文件名或表头需含温度，如 300K")
+        "Upload THz data files (.txt / .zip / .gz)",
+        type=["txt", "zip", "gz"], accept_multiple_files=True,
+        help="Filename or header must contain temperature, e.g. '300K'. "
+             "Zip archives and gzip files of whole sweeps are read directly.\\n"
+             "文件名或表头需含温度，如 300K；可直接上传 zip / gz 压缩的整组扫描")
 
     st.markdown('<div class="sidebar-section">⚙️ Processing · 处理参数</div>',
                 unsafe_allow_html=True)
@@ -246,6 +320,70 @@ with st.sidebar:
     use_avg  = st.checkbox("Use averaged data 使用平均后数据", True,
                            help="When checked, spectra at the same temperature are averaged.\n"
                                 "取消勾选后将使用所有原始扫描数据（不平均）。", on_change=clear_fano_cache)
+    avg_method = st.selectbox(
+        "Averaging method 平均方式", AVG_METHODS,
+        format_func={'mean': "Mean 均值",
+                     'sigma_clip': "Sigma-clipped mean (3σ) 3σ剔除均值",
+                     'median': "Median 中位数"}.get,
+        disabled=not use_avg, on_change=clear_fano_cache,
+        help="How repeated scans at one temperature are combined. Mean streams "
+             "through the scans; sigma-clip (about the median, σ from the MAD) "
+             "and median hold the whole group.\n"
+             "同温度多次扫描的合并方式；均值逐批累加，3σ剔除（以中位数为中心、"
+             "由MAD估计σ）与中位数需整组数据。")
+    use_f32  = st.checkbox("Float32 storage 单精度存储", False,
+                           help="Store loaded spectra in single precision (half the memory). "
+                                "Fitting still computes in float64.\n"
+                                "以单精度存储光谱以减半内存，拟合计算仍使用双精度。",
+                           on_change=force_reload)
+
+    st.markdown('<div class="sidebar-section">🗂️ Scan Catalogue · 扫描目录</div>',
+                unsafe_allow_html=True)
+    with st.expander("Query archived scans  查询历史扫描", expanded=False):
+        catalog = shared_catalog()
+        t_lo, t_hi, n_cat = catalog.temperature_span()
+        if not n_cat:
+            st.caption("Catalogue is empty — scans are added as they are loaded.  "
+                       "目录为空，加载数据后自动记录。")
+        else:
+            cat_sample = st.selectbox("Sample 样品", ["All samples 全部"] + catalog.samples(),
+                                      key="cat_sample")
+            if t_lo is None:
+                # No catalogued scan has a temperature in its header
+                cat_tmin = cat_tmax = None
+            else:
+                _cq1, _cq2 = st.columns(2)
+                with _cq1:
+                    cat_tmin = st.number_input("T min (K)", value=float(t_lo), step=10.0,
+                                               key="cat_tmin")
+                with _cq2:
+                    cat_tmax = st.number_input("T max (K)", value=float(t_hi), step=10.0,
+                                               key="cat_tmax")
+            cat_rows = catalog.query(
+                cat_tmin, cat_tmax,
+                sample=None if cat_sample.startswith("All samples") else cat_sample)
+            st.caption(f"{len(cat_rows)} of {n_cat} catalogued scans match  "
+                       f"匹配 {len(cat_rows)} / {n_cat}")
+            if cat_rows:
+                st.dataframe(pd.DataFrame(cat_rows)[
+                    ['path', 'sample', 'temperature', 'n_points',
+                     'freq_min', 'freq_max', 'snr_td', 'dyn_range_db']],
+                    height=180, hide_index=True, use_container_width=True)
+                if st.button("Open selection 载入所选", key="cat_open",
+                             use_container_width=True):
+                    cat_loader = DataLoader(dtype=np.float32 if use_f32 else np.float64)
+                    recs, missing = cat_loader.load_from_catalog(cat_rows)
+                    by_path = {r['path']: r['digest'] for r in cat_rows}
+                    st.session_state['_catalog_files'] = {
+                        d['origin']: (by_path[d['filename']], d) for d in recs}
+                    log.info(f"Opened {len(recs)} scans from the catalogue")
+                    if missing:
+                        st.warning(f"⚠️ {len(missing)} scans are no longer cached — "
+                                   f"upload them again.  {len(missing)} 个扫描需重新上传")
+            if st.session_state.get('_catalog_files') and st.button(
+                    "Close catalogue scans 移除目录扫描", key="cat_close",
+                    use_container_width=True):
+                st.session_state['_catalog_files'] = {}
 
     st.markdown('<div class="sidebar-section">📈 BCS Fitting · BCS拟合</div>',
                 unsafe_allow_html=True)
@@ -273,7 +411,7 @@ with st.sidebar:
 
     if ref_uploaded:
         if (st.session_state.ref_name != ref_uploaded.name):
-            loader_ref = DataLoader()
+            loader_ref = DataLoader(catalog=False)
             try:
                 st.session_state.ref_data = loader_ref.load_file(ref_uploaded)
                 st.session_state.ref_name = ref_uploaded.name
@@ -325,172 +463,116 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ══════════════════════════════════════════════════════════════
-# TEMPERATURE AVERAGING
+# FILE LOADING
 # ══════════════════════════════════════════════════════════════
-def average_by_temperature(files, tol=1.0):
-    """Group files by temperature (±tol K) and average within each group.
-
-    Returns a list of averaged dicts (same structure as DataLoader output)
-    plus a grouping info dict {temp: [filenames]}.
-
-    Fixes applied:
-    - freq/amp sorted before interpolation
-    - np.linspace for stable common grid
-    - validation of overlapping freq ranges
-    """
-    from collections import defaultdict
-
-    # Sort by temperature
-    sorted_files = sorted(files, key=lambda d: d['temperature'])
-
-    # Group using tolerance
-    groups = []  # [(representative_temp, [file_dicts])]
-    for d in sorted_files:
-        matched = False
-        for g in groups:
-            if abs(d['temperature'] - g[0]) <= tol:
-                g[1].append(d)
-                matched = True
-                break
-        if not matched:
-            groups.append((d['temperature'], [d]))
-
-    averaged = []
-    group_info = {}  # {temp: [filenames]}
-    for rep_temp, members in groups:
-        mean_temp = np.mean([m['temperature'] for m in members])
-        fnames = [m['filename'] for m in members]
-        group_info[round(mean_temp, 1)] = fnames
-
-        if len(members) == 1:
-            m = members[0]
-            averaged.append({
-                'filename': m['filename'],
-                'temperature': m['temperature'],
-                'freq': m['freq'].copy(),
-                'amp': m['amp'].copy(),
-                'amp_db': m.get('amp_db', m['amp']).copy(),
-                'time': m['time'].copy() if 'time' in m else np.array([]),
-                'E_field': m['E_field'].copy() if 'E_field' in m else np.array([]),
-                'n_averaged': 1,
-                'source_files': fnames,
-            })
-            continue
-
-        # ── Ensure each member's freq is sorted ──
-        for m in members:
-            sort_idx = np.argsort(m['freq'])
-            m['freq'] = m['freq'][sort_idx]
-            m['amp'] = m['amp'][sort_idx]
-            if 'amp_db' in m and m['amp_db'] is not None:
-                m['amp_db'] = m['amp_db'][sort_idx]
-
-        # ── Build common frequency grid ──
-        # Use the FIRST member's grid as reference to minimize interpolation
-        # Only interpolate others onto this grid (within overlapping range)
-        ref = members[0]
-        f_min = max(m['freq'].min() for m in members)
-        f_max = min(m['freq'].max() for m in members)
-
-        if f_min >= f_max:
-            # No overlapping range — fall back to first member
-            m = members[0]
-            averaged.append({
-                'filename': f"avg_{mean_temp:.0f}K (NO OVERLAP, using first)",
-                'temperature': mean_temp,
-                'freq': m['freq'].copy(),
-                'amp': m['amp'].copy(),
-                'amp_db': m.get('amp_db', m['amp']).copy(),
-                'time': m.get('time', np.array([])),
-                'E_field': m.get('E_field', np.array([])),
-                'n_averaged': 1,
-                'source_files': fnames,
-            })
-            continue
-
-        # Use reference grid within overlap region
-        ref_mask = (ref['freq'] >= f_min) & (ref['freq'] <= f_max)
-        f_common = ref['freq'][ref_mask]
-
-        if len(f_common) < 2:
-            # Too few points in overlap
-            steps = [np.median(np.abs(np.diff(m['freq']))) for m in members
-                     if len(m['freq']) > 1]
-            df = min(steps) if steps else 0.001
-            n_pts = max(2, int(round((f_max - f_min) / df)))
-            f_common = np.linspace(f_min, f_max, n_pts)
-
-        # ── Interpolate all members onto common grid and average ──
-        interp_amps = []
-        interp_amps_db = []
-        for m in members:
-            interp_amps.append(
-                np.interp(f_common, m['freq'], m['amp']))
-            db_col = m.get('amp_db', m['amp'])
-            interp_amps_db.append(
-                np.interp(f_common, m['freq'], db_col))
-
-        avg_amp = np.mean(interp_amps, axis=0)
-        avg_amp_db = np.mean(interp_amps_db, axis=0)
-
-        # ── Diagnostic Logging ──
-        log.info(f"Math Avg {mean_temp:.0f}K (n={len(members)}): "
-                 f"Linear[mean={avg_amp.mean():.4e}, max={avg_amp.max():.4e}] | "
-                 f"dB[mean={avg_amp_db.mean():.2f}, max={avg_amp_db.max():.2f}]")
-
-        # For time-domain: use the first member's data (needed for dielectric)
-        m0 = members[0]
-        averaged.append({
-            'filename': f"avg_{mean_temp:.0f}K ({len(members)} scans)",
-            'temperature': mean_temp,
-            'freq': f_common,
-            'amp': avg_amp,
-            'amp_db': avg_amp_db,
-            'time': m0.get('time', np.array([])),
-            'E_field': m0.get('E_field', np.array([])),
-            'n_averaged': len(members),
-            'source_files': fnames,
-        })
+_catalog_sel = st.session_state.get('_catalog_files', {})
+_catalog_open = any(o.startswith(CATALOG_ORIGIN)
+                    for o in st.session_state.get('file_digests', {}))
+if uploaded or _catalog_sel or _catalog_open:
+    # Content digests per upload; Streamlit's file_id changes whenever a
+    # file is (re)uploaded, so each upload is hashed only once
+    _digest_by_id = st.session_state.setdefault('_upload_digests', {})
+    up_digests = {}
+    for uf in uploaded or []:
+        fid = getattr(uf, 'file_id', None)
+        dg = _digest_by_id.get(fid) if fid else None
+        if dg is None:
+            dg = content_digest(uf.getvalue())
+            if fid:
+                _digest_by_id[fid] = dg
+        up_digests[uf.name] = dg
+    # Scans reopened from the catalogue count as uploads of their own
+    up_digests.update({o: dg for o, (dg, _) in _catalog_sel.items()})
+
+    old_digests = st.session_state.get('file_digests', {})
+    # Old data format (missing amp_db / origin) forces a full reload
+    if st.session_state.files and not all(
+            k in st.session_state.files[0] for k in ('amp_db', 'origin')):
+        old_digests = {}
+    # Scans that failed to parse, {scan: (upload, upload digest, message)};
+    # their upload is not retried until it changes
+    failed = st.session_state.setdefault('_failed_uploads', {})
+    for name in [n for n, (up, dg, _) in failed.items() if up_digests.get(up) != dg]:
+        del failed[name]
+    tried = {up for up, _, _ in failed.values()}
+    changed = [uf for uf in uploaded or []
+               if old_digests.get(uf.name) != up_digests[uf.name]
+               and uf.name not in tried]
+    cat_changed = [rec for o, (dg, rec) in _catalog_sel.items()
+                   if old_digests.get(o) != dg]
+    removed = set(old_digests) - set(up_digests)
+    need_reload = bool(changed or cat_changed or removed)
 
-    averaged.sort(key=lambda x: x['temperature'])
-    return averaged, group_info
+    if need_reload:
+        loader = DataLoader(dtype=np.float32 if use_f32 else np.float64)
+        prog = st.progress(0)
+        stat = st.empty()
 
+        def _ingest_progress(done, total, name):
+            stat.text(f"Loading {name}  ({done}/{total}) …")
+            prog.progress(done / total)
 
-# ══════════════════════════════════════════════════════════════
-# FILE LOADING
-# ══════════════════════════════════════════════════════════════
-if uploaded:
-    need_reload = (not st.session_state.files or
-                   {f.name for f in uploaded} !=
-                   {d['filename'] for d in st.session_state.files})
-    # Also reload if old data format (missing amp_db)
-    if (not need_reload and st.session_state.files
-            and 'amp_db' not in st.session_state.files[0]):
-        need_reload = True
-    if need_reload:
-        loader = DataLoader()
-        files, errs = [], []
-        for uf in uploaded:
-            try:
-                files.append(loader.load_file(uf))
-                log.info(f"Loaded {uf.name} — T={files[-1]['temperature']:.0f} K, {len(files[-1]['freq'])} pts")
-            except Exception as e:
-                errs.append(f"{uf.name}: {e}")
-                log.error(f"Failed to load {uf.name}: {e}")
-        files.sort(key=lambda x: x['temperature'])
+        new_files, load_errs = loader.load_many(changed, on_progress=_ingest_progress,
+                                                digests=up_digests)
+        new_files.extend(cat_changed)
+        prog.empty(); stat.empty()
+        for d in new_files:
+            log.info(f"Loaded {d['filename']} — T={d['temperature']:.0f} K, {len(d['freq'])} pts")
+        for name, up, msg in load_errs:
+            failed[name] = (up, up_digests[up], msg)
+            log.error(f"Failed to load {name}: {msg}")
+        loaded_from = {d['origin'] for d in new_files}
+        for uf in changed:
+            if uf.name not in loaded_from and uf.name not in {e[1] for e in load_errs}:
+                failed[uf.name] = (uf.name, up_digests[uf.name], "no scans found")
+
+        # Keep untouched scans, swap in new / changed ones. Scans are
+        # tracked by the upload they came from (one archive → many scans)
+        changed_names = {uf.name for uf in changed} | {d['origin'] for d in cat_changed}
+        files = [d for d in st.session_state.files
+                 if d['origin'] in up_digests and d['origin'] not in changed_names]
+        files.extend(new_files)
+        # Upload order within each temperature, as a fresh load gives: the
+        # member order fixes the reference grid and pulse of a group average
+        # (sorting is stable, so scans of one upload keep their order)
+        upload_rank = {o: i for i, o in enumerate(up_digests)}
+        files.sort(key=lambda x: (x['temperature'], upload_rank[x['origin']]))
         st.session_state.files = files
-        log.info(f"Total files loaded: {len(files)}")
-        # Compute averages
-        avg_files, grp_info = average_by_temperature(files)
+        st.session_state.file_digests = {d['origin']: up_digests[d['origin']]
+                                         for d in files}
+        log.info(f"Total files loaded: {len(files)} "
+                 f"({len(new_files)} new/changed, {len(removed)} removed)")
+
+        # Re-average only the temperature groups whose members changed
+        excluded = st.session_state.get('excluded_scans', set())
+        avg_files, grp_info, avg_memo, recomputed = average_incremental(
+            [d for d in files if d['filename'] not in excluded],
+            st.session_state.file_digests,
+            st.session_state.get('_avg_memo', {}), method=avg_method)
         st.session_state.averaged_files = avg_files
         st.session_state.avg_group_info = grp_info
-        st.session_state.results = {}
-        st.session_state.df = None
+        st.session_state['_avg_memo'] = avg_memo
+        st.session_state['_avg_method'] = avg_method
+
+        # Keep fit results whose input spectrum is unchanged
+        stale = {d['filename'] for d in new_files} | set(recomputed)
+        valid = {d['filename'] for d in (avg_files if use_avg else files)} - stale
+        kept_results = {k: v for k, v in st.session_state.results.items()
+                        if k in valid}
+        st.session_state.results = kept_results
+        ok = [r for r in kept_results.values() if r]
+        st.session_state.df = pd.DataFrame(ok) if ok else None
         st.session_state['_files_changed'] = True  # Trigger auto peak-finding
         if st.session_state.step == 1:
             st.session_state.step = 2
-        for e in errs:
-            st.warning(f"⚠️ {e}")
+
+    for name, (_, _, msg) in failed.items():
+        st.warning(f"⚠️ {name}: {msg}")
+
+# A new averaging method recomputes every group (the memo is keyed by method)
+if st.session_state.files and st.session_state.get('_avg_method', 'mean') != avg_method:
+    redone = apply_exclusions(st.session_state.files)
+    log.info(f"Averaging method → {avg_method}: {len(redone)} groups recomputed")
 
 # Render Activity Log in sidebar AFTER file loading is completed so newest logs appear
 with st.sidebar:
@@ -502,6 +584,9 @@ with st.sidebar:
             st.code("\n".join(entries[-30:]), language="log")
         else:
             st.caption("No log entries yet.  暂无日志。")
+        _cs = DataLoader.cache_stats()
+        st.caption(f"Parse cache 解析缓存: {_cs['memory_hits']} memory hits · "
+                   f"{_cs['disk_hits']} disk hits · {_cs['misses']} parsed")
 
 # ── KPI bar ──────────────────────────────────────────────────
 if st.session_state.files:
@@ -785,38 +870,24 @@ else:
     files = st.session_state.files
 raw_files = st.session_state.files
 
-# ── Apply amplitude column selection ──
+# ── Apply amplitude column selection (O(1) views, no copies) ──
 if use_db:
-    import copy
-    files = copy.deepcopy(files)
-    raw_files = copy.deepcopy(raw_files)
-    for d in files:
-        if 'amp_db' in d:
-            d['amp'] = d['amp_db']
-    for d in raw_files:
-        if 'amp_db' in d:
-            d['amp'] = d['amp_db']
+    files = [d.with_amp('amp_db') for d in files]
+    raw_files = [d.with_amp('amp_db') for d in raw_files]
 _amp_label = "Amplitude (dB)" if use_db else "Amplitude (A.U.)"
 
-# ── Apply mode group filtering (from Tab ① Mode Grouping) ──
-if st.session_state.get('mode_group_files') is not None:
-    files = st.session_state['mode_group_files']
-    # Also apply dB override to mode-filtered files if needed
-    if use_db:
-        import copy as _mode_cp
-        files = _mode_cp.deepcopy(files)
-        for d in files:
-            if 'amp_db' in d:
-                d['amp'] = d['amp_db']
-    # Auto-set ROI from mode grouping
-    if st.session_state.get('mode_group_roi') is not None:
-        _mode_roi = st.session_state['mode_group_roi']
-        if 'roi_l_val' not in st.session_state or st.session_state.get('_mode_roi_applied') != _mode_roi:
-            st.session_state['roi_l_val'] = _mode_roi[0]
-            st.session_state['roi_r_val'] = _mode_roi[1]
-            st.session_state['roi_l_num'] = _mode_roi[0]
-            st.session_state['roi_r_num'] = _mode_roi[1]
-            st.session_state['_mode_roi_applied'] = _mode_roi
+# ── Apply the active mode (from Tab ① Mode Grouping) ──
+# Only a descriptor is kept — mode id, centre and ROI — and every scan
+# stays in the shared dataset; the mode only steers the ROI.
+_mode = st.session_state.get('mode_group')
+if _mode is not None:
+    _mode_roi = _mode['roi']
+    if 'roi_l_val' not in st.session_state or st.session_state.get('_mode_roi_applied') != _mode_roi:
+        st.session_state['roi_l_val'] = _mode_roi[0]
+        st.session_state['roi_r_val'] = _mode_roi[1]
+        st.session_state['roi_l_num'] = _mode_roi[0]
+        st.session_state['roi_r_num'] = _mode_roi[1]
+        st.session_state['_mode_roi_applied'] = _mode_roi
 
 # ─────────────────────────────────────────────────
 # TAB 0 — Averaging
@@ -841,6 +912,8 @@ with tab0:
             '# Scans': d.get('n_averaged', 1),
             'Source Files': ', '.join(src),
             'Freq Points': len(d['freq']),
+            'Median σ': (f"{np.nanmedian(d['amp_std']):.3g}"
+                         if d.get('amp_std') is not None else '—'),
         })
     grp_df = pd.DataFrame(grp_rows)
     st.dataframe(grp_df, use_container_width=True, hide_index=True)
@@ -855,19 +928,8 @@ with tab0:
     st.divider()
     sec("Scan Selection  扫描选择", "取消勾选要排除的扫描，然后点击「重新平均」")
 
-    # Group raw files by temperature (same logic as average_by_temperature)
-    from collections import defaultdict
-    sorted_raw = sorted(_raw, key=lambda d: d['temperature'])
-    temp_groups = []
-    for d in sorted_raw:
-        matched = False
-        for g in temp_groups:
-            if abs(d['temperature'] - g[0]) <= 1.0:
-                g[1].append(d)
-                matched = True
-                break
-        if not matched:
-            temp_groups.append((d['temperature'], [d]))
+    # Group raw files by temperature (same grouping as the averaging)
+    temp_groups = group_by_temperature(_raw, tol=1.0)
 
     multi_temp_groups = [(t, members) for t, members in temp_groups if len(members) > 1]
 
@@ -918,6 +980,15 @@ with tab0:
                           if abs(a['temperature'] - mean_t) <= 1.0
                           and a.get('n_averaged', 1) > 1), None)
             if avg_d is not None:
+                if avg_d.get('amp_std') is not None:
+                    _f, _a, _s = avg_d['freq'], avg_d['amp'], avg_d['amp_std']
+                    fig_grp.add_trace(go.Scatter(
+                        x=np.concatenate([_f, _f[::-1]]),
+                        y=np.concatenate([_a + _s, (_a - _s)[::-1]]),
+                        fill='toself', fillcolor='rgba(192,57,43,0.15)',
+                        line=dict(width=0), hoverinfo='skip',
+                        name='±1σ across scans',
+                    ))
                 fig_grp.add_trace(go.Scatter(
                     x=avg_d['freq'], y=avg_d['amp'],
                     mode='lines',
@@ -929,7 +1000,7 @@ with tab0:
             fig_grp.update_yaxes(title_text=_amp_label)
             st.plotly_chart(fig_grp, use_container_width=True, config={'editable': True})
             zh(f"保留 {kept_count}/{len(members)} 个扫描 · "
-               f"虚线/半透明 = 已排除 · 粗红线 = 当前平均结果")
+               f"虚线/半透明 = 已排除 · 粗红线 = 当前平均结果 · 浅红带 = ±1σ")
             st.markdown("---")
 
         # ── Re-average button ──
@@ -944,25 +1015,17 @@ with tab0:
                 if not kept_files:
                     st.error("No scans left after exclusion!  排除后没有数据了！")
                 else:
-                    avg_new, grp_new = average_by_temperature(kept_files)
-                    st.session_state.averaged_files = avg_new
-                    st.session_state.avg_group_info = grp_new
-                    # Clear fitting results since data changed
-                    st.session_state.results = {}
-                    st.session_state.df = None
+                    redone = apply_exclusions(_raw)
                     log.info(f"Re-averaged: {len(kept_files)}/{len(_raw)} scans kept, "
+                             f"{len(redone)} groups recomputed, "
                              f"excluded: {st.session_state.excluded_scans}")
                     st.rerun()
         with rea_col2:
             if st.button("↺ Reset exclusions  重置排除", use_container_width=True,
                          key="tab0_reset_btn"):
                 st.session_state.excluded_scans = set()
-                avg_new, grp_new = average_by_temperature(_raw)
-                st.session_state.averaged_files = avg_new
-                st.session_state.avg_group_info = grp_new
-                st.session_state.results = {}
-                st.session_state.df = None
-                log.info("Exclusions reset, re-averaged with all scans")
+                redone = apply_exclusions(_raw)
+                log.info(f"Exclusions reset, {len(redone)} groups re-averaged")
                 st.rerun()
     else:
         st.info("No temperatures have multiple scans to average.  "
@@ -1011,94 +1074,51 @@ with tab_mg:
         mg_smooth = st.slider(
             "Detection smoothing / 检测平滑",
             1, 15, 5, 2, key="mg_smooth")
+    mg_track = st.checkbox(
+        "Track modes across temperature / 跨温度追踪模式", True,
+        help="Link each dip to the nearest dip at the neighbouring temperature "
+             "(optimal assignment), so a mode that shifts with temperature stays "
+             "one group. Tolerance is then the largest shift between neighbouring "
+             "temperatures. Unchecked: group by frequency alone.\n"
+             "勾选后按相邻温度最优匹配连接凹陷，频移的模式保持为同一组；"
+             "容差为相邻温度间允许的最大频移。",
+        key="mg_track")
 
     # ── Dip detection per scan (within freq range only) ──
-    from scipy.signal import find_peaks
-    import copy as _cp
-
+    # Memoised per stack row, so regrouping/reranking reruns search nothing
     f_search_lo, f_search_hi = mg_freq_range
-    all_dip_records = []
-
-    for d in files:
-        freq_arr = d['freq'].astype(float)
-        amp_arr  = d['amp'].astype(float)
-
-        # Restrict to search range
-        search_mask = (freq_arr >= f_search_lo) & (freq_arr <= f_search_hi)
-        freq_s = freq_arr[search_mask]
-        amp_s  = amp_arr[search_mask]
-        if len(freq_s) < 10:
-            continue
-
-        # Smooth
-        if mg_smooth > 1 and len(amp_s) > mg_smooth:
-            try:
-                from scipy.signal import savgol_filter as _sgf
-                sw = mg_smooth if mg_smooth % 2 == 1 else mg_smooth + 1
-                amp_sm = _sgf(amp_s, sw, 3)
-            except Exception:
-                amp_sm = pd.Series(amp_s).rolling(mg_smooth, center=True).mean().bfill().ffill().values
-        else:
-            amp_sm = amp_s
-
-        # Invert to find dips
-        inverted = -amp_sm + np.max(amp_sm)
-        peaks, props = find_peaks(inverted, width=3,
-                                   prominence=np.max(inverted) * mg_prominence)
-
-        for pi, pk_idx in enumerate(peaks):
-            all_dip_records.append({
-                'filename':    d['filename'],
-                'temperature': d['temperature'],
-                'dip_freq':    float(freq_s[pk_idx]),
-                'dip_amp':     float(amp_s[pk_idx]),
-                'prominence':  float(props['prominences'][pi]),
-            })
+    stack = spectrum_stack(files)
+    dip_finder = st.session_state.setdefault('_dip_finder', DipFinder())
+    row_dips = dip_finder.find(stack, f_search_lo, f_search_hi,
+                               mg_smooth, mg_prominence)
 
-    if not all_dip_records:
+    dips = dip_table(row_dips, stack.temperatures)
+    if not len(dips['freq']):
         st.warning("No dips detected in the search range. "
                    "Try widening the frequency range or lowering prominence.  "
                    "搜索范围内未检测到凹陷。")
         st.stop()
 
-    # ── Clustering ──
-    dip_freqs_all = np.array([r['dip_freq'] for r in all_dip_records])
-    sorted_indices = np.argsort(dip_freqs_all)
-    clusters = []
-
-    current_cluster = [sorted_indices[0]]
-    for idx in sorted_indices[1:]:
-        if dip_freqs_all[idx] - dip_freqs_all[current_cluster[-1]] <= mg_tolerance:
-            current_cluster.append(idx)
-        else:
-            clusters.append(current_cluster)
-            current_cluster = [idx]
-    clusters.append(current_cluster)
-
-    # Build cluster info and sort by total prominence (most significant first)
-    cluster_info = []
-    for ci, members in enumerate(clusters):
-        freqs = dip_freqs_all[members]
-        temps = [all_dip_records[m]['temperature'] for m in members]
-        total_prom = sum(all_dip_records[m]['prominence'] for m in members)
-        cluster_info.append({
-            'id':        ci,
-            'center':    float(np.mean(freqs)),
-            'std':       float(np.std(freqs)) if len(freqs) > 1 else 0.0,
-            'count':     len(members),
-            'min_freq':  float(np.min(freqs)),
-            'max_freq':  float(np.max(freqs)),
-            'temps':     temps,
-            'total_prom': total_prom,
-            'members':   members,
-        })
-
-    # Keep only top N groups by prominence
-    cluster_info.sort(key=lambda x: x['total_prom'], reverse=True)
-    cluster_info = cluster_info[:mg_max_groups]
-    cluster_info.sort(key=lambda x: x['center'])
-    for i, c in enumerate(cluster_info):
-        c['id'] = i
+    # ── Grouping: track across temperature, or chain sorted frequencies ──
+    if mg_track:
+        dip_labels = track_modes(dips, mg_tolerance)
+    else:
+        dip_labels = cluster_by_frequency(dips['freq'], mg_tolerance)
+    g = group_stats(dips, dip_labels)
+
+    # Keep only top N groups by prominence, ordered by centre frequency
+    cluster_info = [{
+        'id':         i,
+        'label':      int(g['label'][j]),
+        'center':     float(g['center'][j]),
+        'std':        float(g['std'][j]),
+        'count':      int(g['count'][j]),
+        'min_freq':   float(g['min_freq'][j]),
+        'max_freq':   float(g['max_freq'][j]),
+        't_min':      float(g['t_min'][j]),
+        't_max':      float(g['t_max'][j]),
+        'total_prom': float(g['total_prom'][j]),
+    } for i, j in enumerate(top_groups(g, mg_max_groups))]
 
     # ── Summary table ──
     st.divider()
@@ -1112,7 +1132,7 @@ with tab_mg:
             'Center (THz)':   f"{c['center']:.3f}",
             'Spread':         f"±{c['std']:.4f}",
             '# Dips found':   c['count'],
-            'T range (K)':    f"{min(c['temps']):.0f} – {max(c['temps']):.0f}",
+            'T range (K)':    f"{c['t_min']:.0f} – {c['t_max']:.0f}",
         })
     st.dataframe(pd.DataFrame(summary_rows), use_container_width=True,
                  hide_index=True)
@@ -1128,24 +1148,67 @@ with tab_mg:
     selected_mode = st.radio("Active mode / 活跃模式", mode_options,
                               key="mg_active", horizontal=True)
 
+    def mode_roi(c):
+        """Fitting ROI of a mode group: its dip span plus a margin, on the grid."""
+        margin = max(0.15, (c['max_freq'] - c['min_freq']) / 2 + 0.15)
+        flo_g, fhi_g = float(stack.freq[0]), float(stack.freq[-1])
+        return (float(np.clip(c['center'] - margin, flo_g, fhi_g)),
+                float(np.clip(c['center'] + margin, flo_g, fhi_g)))
+
+    _prev_mode = st.session_state.get('mode_group')
     if "All scans" in selected_mode:
-        st.session_state['mode_group_files'] = None
-        st.session_state['mode_group_roi']   = None
+        st.session_state['mode_group'] = None
     else:
         mode_idx = int(selected_mode.split("Mode ")[1].split(" @")[0]) - 1
         c = cluster_info[mode_idx]
         # ALL files go downstream — just auto-set ROI
-        mode_files = [_cp.deepcopy(d) for d in files]
-        margin = max(0.15, (c['max_freq'] - c['min_freq']) / 2 + 0.15)
-        flo_g = min(dd['freq'].min() for dd in mode_files)
-        fhi_g = max(dd['freq'].max() for dd in mode_files)
-        auto_l = float(np.clip(c['center'] - margin, flo_g, fhi_g))
-        auto_r = float(np.clip(c['center'] + margin, flo_g, fhi_g))
-        st.session_state['mode_group_files'] = mode_files
-        st.session_state['mode_group_roi']   = (auto_l, auto_r)
+        auto_l, auto_r = mode_roi(c)
+        member_rows = np.unique(dips['row'][dip_labels == c['label']])
+        st.session_state['mode_group'] = {
+            'mode':    mode_idx,
+            'center':  c['center'],
+            'roi':     (auto_l, auto_r),
+        }
         st.success(
             f"✅ Mode {mode_idx+1}: ROI → [{auto_l:.3f}, {auto_r:.3f}] THz  "
-            f"（{len(mode_files)} scans）")
+            f"（dip found in {len(member_rows)}/{len(files)} scans）")
+        if _prev_mode is None or _prev_mode['roi'] != (auto_l, auto_r):
+            st.rerun()  # the ROI is applied at the top of the script
+
+    # ── All modes in one job: Fano for every mode × scan, then BCS per mode ──
+    st.divider()
+    sec("Fit All Modes",
+        "一次性拟合全部模式：每个模式 × 每个温度做 Fano 拟合，再逐模式做 BCS 拟合")
+    if st.button(f"⚡ Fit all {len(cluster_info)} modes (Fano + BCS)  拟合全部模式",
+                 type="primary", use_container_width=True, key="mg_fit_all"):
+        _rois = {f"Mode {c['id']+1}": mode_roi(c) for c in cluster_info}
+        _prog = st.progress(0.0)
+        log.info(f"Mode batch started: {len(_rois)} modes × {len(files)} files")
+        _fits, _bcs, _errs = fit_all_modes(
+            files, _rois, smooth_window=smooth_w, remove_outliers=rm_bad,
+            tc_fixed=tc_fixed,
+            on_progress=lambda n, tot: _prog.progress(n / tot))
+        _prog.empty()
+        st.session_state['mode_results'] = {
+            'fits': _fits, 'bcs': _bcs, 'errors': _errs,
+            'centers': {f"Mode {c['id']+1}": c['center'] for c in cluster_info}}
+
+    _mr = st.session_state.get('mode_results')
+    if _mr is not None:
+        _bcs_tbl = _mr['bcs'].copy()
+        _bcs_tbl.insert(0, 'Center_THz', [_mr['centers'].get(m) for m in _bcs_tbl.index])
+        st.dataframe(_bcs_tbl.round(4), use_container_width=True)
+        if _mr['errors']:
+            st.caption(f"⚠️ {len(_mr['errors'])} fits failed  拟合失败 — "
+                       + "; ".join(f"{m} / {f}: {e}" for m, f, e in _mr['errors'][:5]))
+        with st.expander("Per-mode Fano results  各模式拟合结果", expanded=False):
+            st.dataframe(_mr['fits'].round(5), use_container_width=True)
+        st.download_button(
+            "⬇ Export all-mode results (.csv)",
+            data=_mr['fits'].reset_index().to_csv(index=False).encode(),
+            file_name="all_modes_fano.csv", mime="text/csv",
+            use_container_width=True, key="mg_fit_all_export")
+        zh("每行一个模式：T_c/β/A 分别来自深度和面积的 BCS 拟合")
 
     # ── Per-cluster charts & export (ALL scans, zoomed) ──
     st.divider()
@@ -1173,21 +1236,17 @@ with tab_mg:
             zoom_lo = c['center'] - zoom_margin
             zoom_hi = c['center'] + zoom_margin
 
-            n_f = len(files)
-            colors_f = get_colors(n_f)
+            colors_f = get_colors(stack.n_temps)
             fig_mg = plotly_fig(320,
                 f"Mode {c['id']+1} @ {c['center']:.3f} THz")
 
-            for j, d in enumerate(
-                    sorted(files, key=lambda x: x['temperature'])):
-                fa = d['freq'].astype(float)
-                aa = d['amp'].astype(float)
-                zmask = (fa >= zoom_lo) & (fa <= zoom_hi)
-                if zmask.sum() < 2:
-                    continue
+            _, az = stack.window(zoom_lo, zoom_hi)
+            zrows = np.isfinite(az).sum(axis=1) >= 2
+            for j in np.flatnonzero(zrows):
+                fz_j, az_j = stack.native(j, zoom_lo, zoom_hi)
                 fig_mg.add_trace(go.Scatter(
-                    x=fa[zmask], y=aa[zmask], mode='lines',
-                    name=f"{d['temperature']:.0f} K",
+                    x=fz_j, y=az_j, mode='lines',
+                    name=f"{stack.temperatures[j]:.0f} K",
                     line=dict(color=colors_f[j], width=1.2)))
 
             fig_mg.add_vrect(x0=c['min_freq'] - 0.02,
@@ -1204,22 +1263,10 @@ with tab_mg:
             st.plotly_chart(fig_mg, use_container_width=True,
                             config={'editable': True})
 
-            # Per-group Excel export
-            export_data = {}
-            for d in sorted(files, key=lambda x: x['temperature']):
-                fa = d['freq'].astype(float)
-                aa = d['amp'].astype(float)
-                zmask = (fa >= zoom_lo) & (fa <= zoom_hi)
-                if zmask.sum() < 2:
-                    continue
-                col_name = f"{d['temperature']:.0f}K"
-                if 'Frequency_THz' not in export_data:
-                    export_data['Frequency_THz'] = fa[zmask]
-                export_data[col_name] = np.interp(
-                    export_data['Frequency_THz'], fa[zmask], aa[zmask])
-
-            if export_data:
-                export_df = pd.DataFrame(export_data)
+            # Per-group Excel export (each scan's own points, not resampled)
+            if zrows.any():
+                export_df = stack.to_frame(zoom_lo, zoom_hi, native=True,
+                                           rows=np.flatnonzero(zrows))
                 output_xls = io.BytesIO()
                 with pd.ExcelWriter(output_xls, engine='openpyxl') as xw:
                     export_df.to_excel(xw, index=False,
@@ -1324,7 +1371,10 @@ with tab1:
                 from scipy.signal import find_peaks
                 # Use the lowest temperature data for best peak visibility
                 low_t_data = min(files, key=lambda d: d['temperature'])
-                y_sm = pd.Series(low_t_data['amp'].astype(float)).rolling(window=5, center=True).mean().fillna(method='bfill').fillna(method='ffill').values
+                f_low = np.asarray(low_t_data['freq'], dtype=float)
+                # Same cached preprocessing as the fit itself
+                y_sm = FanoFitter(smooth_window=smooth_w, remove_outliers=rm_bad
+                                  ).prepare([low_t_data['amp']])[0]
                 
                 # Fano in transmission is a dip, so we invert the signal to find peaks
                 inverted_y = -y_sm + np.max(y_sm)
@@ -1334,9 +1384,9 @@ with tab1:
                 
                 if len(peaks) > 0:
                     # Find the peak closest to the user's requested target frequency
-                    peak_freqs = fa[peaks]
+                    peak_freqs = f_low[peaks]
                     closest_peak_idx = peaks[np.argmin(np.abs(peak_freqs - st.session_state['target_f']))]
-                    center_freq = fa[closest_peak_idx]
+                    center_freq = f_low[closest_peak_idx]
                     
                     # Set bounds roughly ±0.25 THz around the peak, bounded by data limits
                     init_l = np.clip(center_freq - 0.25, flo, fhi)
@@ -1401,6 +1451,11 @@ with tab1:
         roi_r = min(roi_r, fhi)
         st.session_state.roi = (roi_l, roi_r)
 
+        warm_fit = st.checkbox(
+            "Warm start along temperature  沿温度热启动", key='fit_warm',
+            help="Fit in temperature order, seeding each fit with the previous "
+                 "result; falls back to the default guess when R² drops. "
+                 "Runs one fit after another instead of in parallel.")
         do_fit = st.button("▶  Run batch Fano fitting\\n批量拟合",
                            type="primary", use_container_width=True)
 
@@ -1469,13 +1524,8 @@ with tab1:
             st.markdown("**Select scans to keep  勾选要保留的扫描（取消勾选 = 排除）**")
 
             # Group raw files by temperature for organized display
-            from collections import defaultdict
-            temp_file_map = defaultdict(list)
-            for d in _all_raw:
-                temp_file_map[d['temperature']].append(d['filename'])
-
-            for temp_k in sorted(temp_file_map.keys()):
-                fnames_in_temp = temp_file_map[temp_k]
+            for temp_k, members in group_by_temperature(_all_raw, tol=1.0):
+                fnames_in_temp = [m['filename'] for m in members]
                 if len(fnames_in_temp) <= 1:
                     continue  # no need for exclusion if only 1 scan
                 st.caption(f"**{temp_k:.0f} K** — {len(fnames_in_temp)} scans")
@@ -1504,51 +1554,46 @@ with tab1:
                             if f['filename'] not in st.session_state.excluded_scans]
                     if not kept:
                         st.error("Cannot exclude all scans!  不能排除所有数据！")
-                    elif n_excl == 0:
-                        st.info("No scans excluded. Nothing to change.  没有排除任何扫描。")
                     else:
-                        avg_new, grp_new = average_by_temperature(kept)
-                        st.session_state.averaged_files = avg_new
-                        st.session_state.avg_group_info = grp_new
-                        st.session_state.results = {}
-                        st.session_state.df = None
-                        log.info(f"Re-averaged from ROI tab: "
-                                 f"{len(kept)}/{len(_all_raw)} kept, "
-                                 f"excluded={st.session_state.excluded_scans}")
-                        st.rerun()
+                        redone = apply_exclusions(_all_raw)
+                        if not redone:
+                            st.info("Selection unchanged. Nothing to re-average.  "
+                                    "选择未改变，无需重新平均。")
+                        else:
+                            log.info(f"Re-averaged from ROI tab: "
+                                     f"{len(kept)}/{len(_all_raw)} kept, "
+                                     f"{len(redone)} groups recomputed, "
+                                     f"excluded={st.session_state.excluded_scans}")
+                            st.rerun()
             with btn_c2:
                 if st.button("↺ Reset all  重置", use_container_width=True,
                              key="roi_reset_btn"):
                     st.session_state.excluded_scans = set()
-                    avg_new, grp_new = average_by_temperature(_all_raw)
-                    st.session_state.averaged_files = avg_new
-                    st.session_state.avg_group_info = grp_new
-                    st.session_state.results = {}
-                    st.session_state.df = None
-                    log.info("ROI tab: exclusions reset")
+                    redone = apply_exclusions(_all_raw)
+                    log.info(f"ROI tab: exclusions reset, {len(redone)} groups re-averaged")
                     st.rerun()
 
             zh(f"实线 = 保留 · 虚线/半透明 = 已排除 · "
                f"当前排除 {n_excl} 个扫描 · "
-               f"点击「应用并重新平均」后会重新计算平均数据并清除之前的拟合结果")
+               f"点击「应用并重新平均」后只重新计算并重新拟合受影响的温度组")
 
         else:
             # ── All files overlay ──
-            n_files = len(files)
+            stack = spectrum_stack(files)
+            n_files = stack.n_temps
             colors_all = get_colors(n_files)
             fig = plotly_fig(480, f"All Spectra ({n_files} files)  ·  全部光谱叠加")
-            for i, d in enumerate(files):
-                fx = d['freq'].astype(float)
-                fy = d['amp'].astype(float)
+            for i, T in enumerate(stack.temperatures):
                 show_leg = (i == 0 or i == n_files - 1 or n_files <= 8)
+                f_i, a_i = stack.native(i)          # own points, not resampled
                 fig.add_trace(go.Scatter(
-                    x=fx, y=fy, mode='lines',
-                    name=f"{d['temperature']:.0f} K",
+                    x=f_i, y=a_i, mode='lines',
+                    name=f"{T:.0f} K",
                     line=dict(color=colors_all[i], width=1.0),
                     showlegend=show_leg,
                     legendgroup=str(i),
                     hovertemplate=(
-                        f"<b>{d['temperature']:.0f} K</b><br>"
+                        f"<b>{T:.0f} K</b><br>"
                         f"f = %{{x:.3f}} THz<br>"
                         f"amp = %{{y:.4f}}<extra></extra>"),
                 ))
@@ -1562,20 +1607,10 @@ with tab1:
             st.plotly_chart(fig, use_container_width=True, config={'editable': True})
 
             # --- Export Overlay Data ---
-            dfs = []
-            for d in files:
-                df_temp = pd.DataFrame({
-                    'Freq_Rounded': np.round(d['freq'].astype(float), 4),
-                    f'Amplitude_{d["temperature"]:.0f}K': d['amp']
-                })
-                # Drop potential duplicates due to rounding
-                df_temp = df_temp.drop_duplicates(subset=['Freq_Rounded']).set_index('Freq_Rounded')
-                dfs.append(df_temp)
-
-            # Concatenate all dataframes along columns based on the rounded frequency index
-            df_export = pd.concat(dfs, axis=1).sort_index()
-            df_export.index.name = 'Frequency (THz)'
-            df_export.reset_index(inplace=True)
+            # One column per temperature; scans on differing grids keep
+            # their own frequency column instead of resampled values
+            df_export = stack.to_frame(freq_col='Frequency (THz)',
+                                       label='Amplitude_{T:.0f}K', native=True)
 
             output = io.BytesIO()
             with pd.ExcelWriter(output, engine='openpyxl') as writer:
@@ -1592,27 +1627,59 @@ with tab1:
             zh(f"颜色：蓝→低温，红→高温 · 共 {n_files} 条曲线 · "
                "阴影区域为选定的 ROI 范围")
 
+    # ── model-free preview ─────────────────────────
+    if roi_l < roi_r:
+        prev = roi_preview(spectrum_stack(files), (roi_l, roi_r), smooth_w, rm_bad)
+        with st.expander("⚡ Quick preview (model-free)  快速预览（无模型）",
+                         expanded=st.session_state.df is None):
+            st.caption("Read directly off the smoothed ROI, baseline through the ROI "
+                       "end points — no Fano fit. Run the batch fit for final values.")
+            pc = st.columns(4)
+            for container, ycol, ylab, color in [
+                (pc[0], 'Peak_Freq_THz', 'f_peak (THz)',    '#1a5f8a'),
+                (pc[1], 'Linear_Depth',  'Depth (a.u.)',    '#c0392b'),
+                (pc[2], 'FWHM_THz',      'FWHM (THz)',      '#27ae60'),
+                (pc[3], 'Area',          'Area (a.u.·THz)', '#8e44ad'),
+            ]:
+                f2 = plotly_fig(230, ylab)
+                f2.add_trace(go.Scatter(x=prev['Temperature_K'], y=prev[ycol],
+                    mode='markers+lines',
+                    marker=dict(size=6, color=color, symbol='circle-open',
+                                line=dict(width=1.2, color=color)),
+                    line=dict(color=color, width=1.0, dash='dot')))
+                f2.update_xaxes(title_text='Temperature (K)')
+                f2.update_yaxes(title_text=ylab)
+                container.plotly_chart(f2, use_container_width=True)
+            zh("预览：以ROI两端连线为基线，直接由平滑后的光谱计算峰位、深度、半高宽与面积，"
+               "所有温度一次向量化完成；最终结果以Fano拟合为准")
+
     # ── batch fitting ──────────────────────────────
     if do_fit:
-        fitter = FanoFitter(smooth_window=smooth_w, remove_outliers=rm_bad)
+        fitter = FanoFitter(smooth_window=smooth_w, remove_outliers=rm_bad,
+                           cache=shared_fit_cache())
         roi    = st.session_state.roi
         prog   = st.progress(0)
         stat   = st.empty()
-        results= {}
         log.info(f"Batch Fano fitting started: {len(files)} files, ROI={roi}")
-        for i, d in enumerate(files):
-            stat.text(f"Fitting {d['filename']}  ({i+1}/{len(files)}) …")
-            try:
-                r = fitter.fit(d['freq'].astype(float),
-                               d['amp'].astype(float),
-                               roi, d['temperature'], d['filename'])
-                results[d['filename']] = r
-                log.info(f"  ✓ {d['temperature']:.0f} K  R²={r['R_squared']:.4f}")
-            except Exception as e:
-                st.warning(f"⚠️ {d['filename']}: {e}")
-                log.warning(f"  ✗ {d['filename']}: {e}")
-                results[d['filename']] = None
-            prog.progress((i+1)/len(files))
+
+        def _fit_progress(done, total, fname):
+            stat.text(f"Fitted {fname}  ({done}/{total}) …")
+            prog.progress(done / total)
+
+        if warm_fit:
+            results, errors, stats = fitter.fit_sequence(files, roi,
+                                                         on_progress=_fit_progress)
+            st.session_state['fit_stats'] = stats
+        else:
+            # Fans out over a process pool; results come back in `files` order
+            results, errors = fitter.fit_many(files, roi, on_progress=_fit_progress)
+            st.session_state['fit_stats'] = None
+        for fname, r in results.items():
+            if r is None:
+                st.warning(f"⚠️ {fname}: {errors[fname]}")
+                log.warning(f"  ✗ {fname}: {errors[fname]}")
+            else:
+                log.info(f"  ✓ {r['Temperature_K']:.0f} K  R²={r['R_squared']:.4f}")
         st.session_state.results = results
         ok = [r for r in results.values() if r]
         st.session_state.df = pd.DataFrame(ok) if ok else None
@@ -1655,6 +1722,27 @@ with tab1:
         st.dataframe(styled, use_container_width=True, height=300,
                      hide_index=True)
 
+        # ── warm-start convergence ─────────────────
+        _stats = st.session_state.get('fit_stats')
+        if _stats:
+            with st.expander("Warm vs cold start · convergence  热启动与冷启动收敛统计"):
+                df_st = pd.DataFrame(_stats)
+                sc1, sc2 = st.columns(2)
+                for container, tag, label in [(sc1, 'warm', 'Warm start 热启动'),
+                                              (sc2, 'cold', 'Cold start 冷启动')]:
+                    ran = df_st[f'nfev_{tag}'].notna()
+                    container.metric(label,
+                        f"{df_st.loc[ran, f'nfev_{tag}'].mean():.1f} nfev/fit" if ran.any() else "—",
+                        f"{df_st.loc[ran, f'ms_{tag}'].mean():.1f} ms/fit · {int(ran.sum())} fits"
+                        if ran.any() else None, delta_color='off')
+                st.dataframe(df_st.style.format({'Temperature_K': '{:.1f}',
+                                                 'nfev_warm': '{:.0f}', 'nfev_cold': '{:.0f}',
+                                                 'ms_warm': '{:.2f}', 'ms_cold': '{:.2f}'},
+                                                na_rep='—'),
+                             use_container_width=True, hide_index=True)
+                zh("热启动：以上一温度的收敛参数为初值；R²下降时改用默认初值重拟合并保留较优者"
+                   "（Start = fallback）")
+
         # ── quick trend row ────────────────────────
         df   = st.session_state.df.sort_values('Temperature_K')
         T    = df['Temperature_K'].values.astype(float)
@@ -1678,9 +1766,17 @@ with tab1:
 # TAB 2 — BCS analysis
 # ─────────────────────────────────────────────────
 with tab2:
-    if st.session_state.df is None:
-        st.info("Complete Fano fitting in Tab ② first.  请先在 ② 完成拟合。")
-        st.stop()
+    # Before the fits exist, show the model-free preview of the current ROI
+    bcs_preview = st.session_state.df is None
+    if bcs_preview:
+        roi = st.session_state.roi
+        prev = (roi_preview(spectrum_stack(files), roi, smooth_w, rm_bad)
+                if files and roi[0] < roi[1] else None)
+        if prev is None or prev['Linear_Depth'].notna().sum() < 4:
+            st.info("Complete Fano fitting in Tab ② first.  请先在 ② 完成拟合。")
+            st.stop()
+        st.info("Preview from model-free ROI metrics — run the Fano fit in Tab ② "
+                "for final values.  当前为无模型预览，最终结果请在 ② 完成拟合。")
 
     sec("BCS Order Parameter Fitting",
         "BCS序参量温度依赖拟合 · Δ(T) = A·tanh(β√(Tc/T−1))")
@@ -1709,7 +1805,7 @@ with tab2:
             'tc_bounds': (tc_lo, tc_hi), 'beta_bounds': (beta_lo, beta_hi),
         }
 
-    df  = st.session_state.df.sort_values('Temperature_K')
+    df  = (prev if bcs_preview else st.session_state.df).sort_values('Temperature_K')
     bcs = BCSAnalyzer(tc_fixed=tc_fixed)
     T   = df['Temperature_K'].values.astype(float)
     T_s = np.linspace(T.min()*0.82, max(T.max()+15, 360), 600)
@@ -1734,7 +1830,8 @@ with tab2:
                           annotation_text=f'T_c = {Tc:.1f} K',
                           annotation_position='top right',
                           annotation_font_size=11)
-            st.session_state.fitted_tc = f"{Tc:.1f} K"
+            if not bcs_preview:
+                st.session_state.fitted_tc = f"{Tc:.1f} K"
         fig.update_xaxes(title_text='Temperature (K)')
         fig.update_yaxes(title_text=ylab, rangemode='tozero')
         # Allow plotly to auto-place legend outside data bounds
@@ -1985,6 +2082,8 @@ with tab4:
     sec("Optical Constants & Dielectric Functions",
         "光学常数与复介电函数 · n, k, ε₁, ε₂")
     zh("方法：频域传输函数法 H(ω)=S_sam/S_ref → n(ω) → k(ω) → ε(ω)=ε₁+iε₂")
+    if use_avg:
+        zh("平均数据的时域脉冲先经互相关（亚采样精度）对齐再平均")
 
     # ── Formula documentation ──
     with st.expander("📐 Optical Constants — Formulas & Theory / 公式与理论", expanded=False):
@@ -0,0 +1,60 @@
+"""
+bench_parser.py — bulk vs line-by-line parsing of instrument .txt files.
+
+Generates synthetic delay-stage scans with 1k, 100k and 1M rows and times
+the vectorized numeric-block parser against the tolerant per-line parser
+used before. Run with:  python bench_parser.py
+"""
+import time
+import numpy as np
+
+from modules.data_loader import DataLoader
+
+
+def make_scan(n_rows, temperature=70.0):
+    """Build the text of a synthetic scan in the instrument's layout."""
+    pos  = np.linspace(0.0, 1000.0, n_rows)
+    t    = np.linspace(0.0, 100.0, n_rows)
+    E    = np.sin(t) * np.exp(-(t - 20.0) ** 2 / 10.0)
+    f    = np.linspace(0.0, 5.0, n_rows)
+    amp  = 1.0 + 0.5 * np.cos(f)
+    adb  = 20 * np.log10(amp)
+    header = (f"Description: TNS 3 {temperature:.0f}K\n"
+              "Start Position 12.5\n"
+              + "".join(f"Meta{i}: -\n" for i in range(10))
+              + "Pos. [um]\tTime [ps]\tE [a.u.]\tFreq [THz]\tAmp\tAmp dB\n")
+    body = "\n".join("\t".join(f"{v:.6e}" for v in row)
+                     for row in np.column_stack([pos, t, E, f, amp, adb]))
+    return (header + body + "\n").encode('utf-8')
+
+
+def _best_of(fn, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main():
+    print(f"{'rows':>9}  {'line loop (s)':>14}  {'bulk (s)':>10}  {'speed-up':>8}")
+    for n_rows in (1_000, 100_000, 1_000_000):
+        raw = make_scan(n_rows)
+        content = raw.decode('utf-8')
+        _, offset = DataLoader._split_header(content)
+        block = content[offset:]
+        repeat = 5 if n_rows < 1_000_000 else 2
+
+        t_loop, a_loop = _best_of(
+            lambda: DataLoader._parse_rows_tolerant(block.splitlines()), repeat)
+        t_bulk, a_bulk = _best_of(
+            lambda: DataLoader._parse_numeric_block(block), repeat)
+
+        assert np.array_equal(a_loop, a_bulk), "parsers disagree"
+        print(f"{n_rows:>9}  {t_loop:>14.4f}  {t_bulk:>10.4f}  "
+              f"{t_loop / t_bulk:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""
+averaging.py — temperature grouping and averaging of repeated scans.
+
+Scans are grouped by a sort-and-split over their temperatures: a group
+opens at the coldest unassigned scan and takes every scan within ``tol`` K
+of it, found with one ``searchsorted`` per group. Each group is then
+interpolated onto a common frequency grid in batches of members (laid end
+to end on a shifted axis) and folded into a streaming accumulator, so the
+mean's memory per group stays O(n_freq) however many repeats it has.
+Besides the mean, every averaged record carries the per-point standard
+deviation and scan count (``amp_std`` / ``n_used``) as a noise estimate.
+
+Methods: ``'mean'`` (single streaming pass), ``'sigma_clip'`` (drops points
+more than ``clip_sigma`` robust standard deviations, 1.4826·MAD, from the
+per-point median) and ``'median'``; the last two need the whole
+interpolated group at once.
+
+The time-domain pulses of a group are averaged too, for the dielectric
+calculation: every pulse is aligned to the first member's by FFT
+cross-correlation with a sub-sample (parabolic) peak, shifted by a phase
+ramp and averaged on the first member's time axis (``average_pulses``).
+
+Nothing here modifies its inputs: loaded spectra are read-only
+SpectrumRecords and results share or copy their arrays, never sort them in
+place.
+"""
+import numpy as np
+from scipy.fft import irfft, next_fast_len, rfft
+
+from modules.logger import get_logger
+from modules.spectrum_record import SpectrumRecord
+
+log = get_logger("thz.avg")
+
+AVG_METHODS = ('mean', 'sigma_clip', 'median')
+
+# Members interpolated per batch: bounds the working set of one group
+_CHUNK = 32
+# MAD → standard deviation for normally distributed noise
+_MAD_SIGMA = 1.4826
+
+
+class RunningStats:
+    """Streaming per-point count, mean and variance (Welford / Chan et al.).
+
+    Blocks of rows are merged with the pairwise update, so each block is
+    one vectorised step. NaN or masked entries are skipped and every point
+    keeps its own count. Memory is O(n_cols · n) however many rows are added.
+    """
+
+    def __init__(self, n, n_cols=2):
+        self.count = np.zeros(n)
+        self._mean = np.zeros((n_cols, n))
+        self._m2 = np.zeros((n_cols, n))
+
+    def add(self, block, mask=None):
+        """Fold in ``block`` of shape ``(n_cols, k, n)``; ``mask`` ``(k, n)`` marks usable entries."""
+        k = block.shape[1]
+        if mask is None and np.isfinite(block.sum()):
+            # Common case: every entry usable, plain reductions suffice
+            n_b = np.full(block.shape[2], float(k))
+            mean_b = block.mean(axis=1)
+            d = block - mean_b[:, None, :]
+            m2_b = np.einsum('ckn,ckn->cn', d, d)
+        else:
+            ok = np.isfinite(block).all(axis=0)
+            if mask is not None:
+                ok &= mask
+            n_b = ok.sum(axis=0).astype(float)
+            if not n_b.any():
+                return
+            mean_b = np.where(ok, block, 0.0).sum(axis=1) / np.maximum(n_b, 1)
+            m2_b = (np.where(ok, block - mean_b[:, None, :], 0.0) ** 2).sum(axis=1)
+
+        if not self.count.any():
+            self.count, self._mean, self._m2 = n_b, mean_b, m2_b
+            return
+        n_a = self.count
+        n = n_a + n_b
+        w = np.divide(n_b, n, out=np.zeros_like(n), where=n > 0)
+        delta = mean_b - self._mean
+        self._mean += delta * w
+        self._m2 += m2_b + delta ** 2 * (n_a * w)
+        self.count = n
+
+    @property
+    def mean(self):
+        return np.where(self.count > 0, self._mean, np.nan)
+
+    @property
+    def std(self):
+        """Sample standard deviation (ddof=1); NaN where fewer than two rows."""
+        var = np.divide(self._m2, self.count - 1, out=np.full_like(self._m2, np.nan),
+                        where=self.count > 1)
+        return np.sqrt(var)
+
+
+def average_by_temperature(files, tol=1.0, method='mean', clip_sigma=3.0):
+    """Group files by temperature (±tol K) and average within each group.
+
+    Returns a list of averaged SpectrumRecords (same structure as DataLoader
+    output, sorted by temperature) plus a grouping info dict
+    ``{temp: [filenames]}``.
+    """
+    averaged = [average_group(members, method, clip_sigma)
+                for _, members in group_by_temperature(files, tol)]
+    averaged.sort(key=lambda x: x['temperature'])
+    return averaged, group_info(averaged)
+
+
+def average_incremental(files, digests, memo, tol=1.0, method='mean',
+                        clip_sigma=3.0):
+    """Re-average only the temperature groups whose member scans changed.
+
+    ``memo`` maps a group signature (averaging method, sorted member
+    filenames + content digests of the uploads they came from) to its
+    averaged record from a previous run; groups with an unchanged signature
+    reuse that record instead of being recomputed.
+
+    Returns (averaged, group_info, new_memo, recomputed_names).
+    """
+    averaged, new_memo, recomputed = [], {}, []
+    for _, members in group_by_temperature(files, tol):
+        sig = (method, clip_sigma) + tuple(sorted(
+            (m['filename'], digests.get(m.get('origin', m['filename'])))
+            for m in members))
+        rec = memo.get(sig)
+        if rec is None:
+            rec = average_group(members, method, clip_sigma)
+            recomputed.append(rec['filename'])
+        new_memo[sig] = rec
+        averaged.append(rec)
+    averaged.sort(key=lambda x: x['temperature'])
+    return averaged, group_info(averaged), new_memo, recomputed
+
+
+def group_by_temperature(files, tol=1.0):
+    """Split files into ±tol K groups: ``[(representative_temp, [files])]``.
+
+    A group's representative is its coldest scan; every scan within
+    ``tol`` of it joins the group, and the next group opens at the first
+    scan beyond that. Scans at equal temperature keep their input order.
+    """
+    if not files:
+        return []
+    temps = np.array([d['temperature'] for d in files], dtype=float)
+    order = np.argsort(temps, kind='stable')
+    t_sorted = temps[order]
+
+    groups = []
+    start, n = 0, len(order)
+    while start < n:
+        stop = int(np.searchsorted(t_sorted, t_sorted[start] + tol, side='right'))
+        groups.append((files[order[start]]['temperature'],
+                       [files[i] for i in order[start:stop]]))
+        start = stop
+    return groups
+
+
+def group_info(averaged):
+    """{temp: [filenames]} summary of an averaged list."""
+    return {round(a['temperature'], 1): a['source_files'] for a in averaged}
+
+
+def average_group(members, method='mean', clip_sigma=3.0):
+    """Average one temperature group onto a common frequency grid."""
+    if method not in AVG_METHODS:
+        raise ValueError(f"Unknown averaging method {method!r}; use one of {AVG_METHODS}")
+    mean_temp = float(np.mean([m['temperature'] for m in members]))
+    fnames = [m['filename'] for m in members]
+    members = [_as_record(m) for m in members]
+
+    # Single-member groups share the member's read-only arrays
+    if len(members) == 1:
+        return members[0].clone(n_averaged=1, source_files=fnames)
+
+    members = [m.sorted_by_freq() for m in members]
+
+    # ── Build common frequency grid ──
+    # The FIRST member's grid within the overlapping range, so that scans
+    # on the same grid need no interpolation at all
+    ref = members[0]
+    f_min = max(m.freq[0] for m in members)
+    f_max = min(m.freq[-1] for m in members)
+
+    if f_min >= f_max:
+        # No overlapping range — fall back to first member
+        return ref.clone(
+            filename=f"avg_{mean_temp:.0f}K (NO OVERLAP, using first)",
+            temperature=mean_temp, n_averaged=1, source_files=fnames)
+
+    ref_mask = (ref.freq >= f_min) & (ref.freq <= f_max)
+    f_common = np.asarray(ref.freq[ref_mask], dtype=float)
+
+    if len(f_common) < 2:
+        # Too few points in overlap
+        steps = [np.median(np.abs(np.diff(m.freq))) for m in members
+                 if len(m.freq) > 1]
+        df = min(steps) if steps else 0.001
+        n_pts = max(2, int(round((f_max - f_min) / df)))
+        f_common = np.linspace(f_min, f_max, n_pts)
+
+    # ── Interpolate in batches and accumulate ──
+    avg, stats = _reduce(f_common, members, method, clip_sigma)
+    avg_amp, avg_amp_db = avg
+    spread = np.vstack([stats.count[None, :], stats.std])
+    spread.flags.writeable = False
+
+    log.info(f"Math Avg {mean_temp:.0f}K (n={len(members)}, {method}): "
+             f"Linear[mean={avg_amp.mean():.4e}, max={avg_amp.max():.4e}] | "
+             f"dB[mean={avg_amp_db.mean():.2f}, max={avg_amp_db.max():.2f}]")
+
+    # Time domain: aligned average of the pulses (needed for dielectric)
+    t_avg, E_avg = average_pulses(members)
+    return SpectrumRecord.from_columns(
+        f"avg_{mean_temp:.0f}K ({len(members)} scans)", mean_temp,
+        f_common, avg_amp, avg_amp_db, time=t_avg, E_field=E_avg,
+        n_averaged=len(members), source_files=fnames, spread=spread)
+
+
+def average_pulses(members):
+    """Average the time-domain pulses of ``members`` after aligning them.
+
+    Pulses are placed on the first member's time axis (resampled only if a
+    member's axis differs, e.g. another start position), then each batch
+    of pulses is cross-correlated with the first one through one real FFT.
+    The correlation peak, refined by a parabola through its neighbours,
+    gives every pulse's delay in fractional samples; the pulses are shifted
+    back by a phase ramp in the same spectra and folded into a running
+    mean. Returns ``(time, E_field)``; members without usable time-domain
+    data leave the first member's pulse unchanged.
+    """
+    m0 = members[0]
+    t0 = np.asarray(m0.get('time', np.array([])), dtype=float)
+    E0 = np.asarray(m0.get('E_field', np.array([])), dtype=float)
+    n = len(t0)
+    if len(members) < 2 or n < 4 or len(E0) != n:
+        return m0.get('time', np.array([])), m0.get('E_field', np.array([]))
+    if any(len(m.get('E_field', ())) < 2 or len(m.get('time', ())) != len(m['E_field'])
+           for m in members[1:]):
+        log.warning(f"Pulse averaging skipped at {m0['temperature']:.0f}K: "
+                    f"a member has no time-domain data")
+        return m0.get('time', np.array([])), m0.get('E_field', np.array([]))
+
+    # Zero-padding to ≥ 2n keeps the circular correlation free of wrap-around
+    n_fft = next_fast_len(2 * n, real=True)
+    X0 = np.conj(rfft(E0, n=n_fft))
+    k = np.arange(len(X0))
+    stats = RunningStats(n, n_cols=1)
+    shifts = []
+    for i in range(0, len(members), _CHUNK):
+        block = np.stack([_on_axis(t0, m) for m in members[i:i + _CHUNK]])
+        X = rfft(block, n=n_fft, axis=-1)
+        lag = _peak_lag(irfft(X * X0, n=n_fft, axis=-1))
+        ramp = np.exp(2j * np.pi * np.outer(lag, k) / n_fft)
+        aligned = irfft(X * ramp, n=n_fft, axis=-1)[:, :n]
+        stats.add(aligned[None])
+        shifts.append(lag)
+
+    shifts = np.concatenate(shifts) * (t0[1] - t0[0])
+    log.info(f"Pulse avg {m0['temperature']:.0f}K (n={len(members)}): "
+             f"shifts {shifts.min():+.4f}…{shifts.max():+.4f} ps")
+    E_avg = stats.mean[0]
+    E_avg.flags.writeable = False
+    return m0['time'], E_avg
+
+
+# ── private ─────────────────────────────────────────────────────────────────
+def _as_record(m):
+    """Plain spectrum dicts (tests, older callers) become records; no mutation."""
+    if isinstance(m, SpectrumRecord):
+        return m
+    return SpectrumRecord.from_columns(
+        m['filename'], m['temperature'], m['freq'], m['amp'], m.get('amp_db'),
+        time=m.get('time'), E_field=m.get('E_field'),
+        start_pos=m.get('start_pos', 0.0))
+
+
+def _reduce(f_common, members, method, clip_sigma):
+    """Averaged ``(2, n)`` linear/dB columns plus the RunningStats behind them."""
+    stats = RunningStats(len(f_common))
+    if method == 'median':
+        # The median has no streaming form: it needs the whole group
+        block = _interp_rows(f_common, members)
+        stats.add(block)
+        return np.median(block, axis=1), stats
+
+    if method == 'mean' or len(members) < 3:
+        for i in range(0, len(members), _CHUNK):
+            stats.add(_interp_rows(f_common, members[i:i + _CHUNK]))
+        return stats.mean, stats
+
+    # Sigma clip: keep points within clip_sigma robust σ (1.4826·MAD) of
+    # the per-point median of the linear column (the same points in dB).
+    # Against the plain mean and σ one outlier among n scans sits at most
+    # (n-1)/√n σ out, so small groups could never be clipped; the median
+    # and MAD are not dragged along by the outlier. Where the MAD is zero
+    # (identical scans) nothing is dropped.
+    block = _interp_rows(f_common, members)
+    centre = np.median(block[0], axis=0)
+    scale = _MAD_SIGMA * np.median(np.abs(block[0] - centre), axis=0)
+    limit = np.where(scale > 0, clip_sigma * scale, np.inf)
+    stats.add(block, mask=~(np.abs(block[0] - centre) > limit))
+    return stats.mean, stats
+
+
+def _on_axis(t0, m):
+    """Member's pulse on the time axis ``t0`` (zero outside its own span)."""
+    t = np.asarray(m['time'], dtype=float)
+    E = np.asarray(m['E_field'], dtype=float)
+    if len(t) == len(t0) and np.allclose(t, t0, rtol=0, atol=1e-9):
+        return E
+    return np.interp(t0, t, E, left=0.0, right=0.0)
+
+
+def _peak_lag(xcorr):
+    """Fractional-sample lag of each row's correlation maximum.
+
+    Lags past the middle of the (zero-padded) record are negative. A
+    parabola through the peak and its two neighbours refines the integer
+    position.
+    """
+    n_fft = xcorr.shape[-1]
+    i = np.argmax(xcorr, axis=-1)
+    rows = np.arange(len(i))
+    y_m = xcorr[rows, i - 1]
+    y_0 = xcorr[rows, i]
+    y_p = xcorr[rows, (i + 1) % n_fft]
+    denom = y_m - 2 * y_0 + y_p
+    frac = np.divide(0.5 * (y_m - y_p), denom, out=np.zeros_like(denom),
+                     where=denom < 0)
+    lag = i + np.clip(frac, -0.5, 0.5)
+    return np.where(lag > n_fft / 2, lag - n_fft, lag)
+
+
+def _interp_rows(f_common, members):
+    """Linear and dB amplitudes of every member on ``f_common``.
+
+    Both are read from rows 1 and 2 of the record's ``fd`` block, whichever
+    column the record's ``amp`` view points at. Returns a
+    ``(2, n_members, len(f_common))`` array. Members already on
+    ``f_common`` are sliced directly; the rest are laid end to end on a
+    shifted frequency axis (member k offset by k·span) and each column is
+    interpolated for all of them in one ``np.interp`` call.
+    """
+    n = len(f_common)
+    out = np.empty((2, len(members), n))
+    todo = []
+    for k, m in enumerate(members):
+        f = m.freq
+        i0 = int(np.searchsorted(f, f_common[0]))
+        if i0 + n <= len(f) and np.array_equal(f[i0:i0 + n], f_common):
+            out[:, k] = m.fd[1:3, i0:i0 + n]
+        else:
+            todo.append(k)
+    if not todo:
+        return out
+
+    lo = float(min(min(members[k].freq[0] for k in todo), f_common[0]))
+    hi = float(max(max(members[k].freq[-1] for k in todo), f_common[-1]))
+    span = (hi - lo) + 1.0
+    # float64 throughout: float32 storage would lose the offsets' precision
+    xs = np.concatenate([np.asarray(members[k].freq, dtype=float) - lo + j * span
+                         for j, k in enumerate(todo)])
+    ys = np.concatenate([np.asarray(members[k].fd[1:3], dtype=float) for k in todo],
+                        axis=1)
+    xq = ((f_common - lo)[None, :] + (np.arange(len(todo)) * span)[:, None]).ravel()
+
+    for c in range(2):
+        out[c, todo] = np.interp(xq, xs, ys[c]).reshape(len(todo), n)
+    return out
@@ -1,16 +1,14 @@
 import numpy as np
 from scipy.optimize import curve_fit
 
+from modules.fano_kernel import bcs
+
 class BCSAnalyzer:
     def __init__(self, tc_fixed=None):
         self.tc_fixed = tc_fixed
 
     def bcs(self, T, amp, Tc, beta=1.76):
-        val = np.zeros_like(T, dtype=float)
-        m   = T < Tc
-        if m.any():
-            val[m] = amp * np.tanh(beta * np.sqrt(np.maximum(0, Tc/T[m] - 1)))
-        return val
+        return bcs(T, amp, Tc, beta)
 
     def fit(self, temps, values):
         mask = ~np.isnan(values) & (values > 0)
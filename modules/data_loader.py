@@ -1,22 +1,103 @@
+import gzip
+import io
+import os
 import re
+import threading
+import warnings
+import zipfile
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 import numpy as np
 import streamlit as st
 
+from modules.digest import content_digest
+from modules.logger import get_logger
+from modules.scan_catalog import shared_catalog
+from modules.spectrum_cache import SpectrumCache
+from modules.spectrum_record import SpectrumRecord
+
+log = get_logger("thz.loader")
+
+# Shared on-disk caches of parsed spectra, one per storage dtype
+# (survive restarts and redeploys)
+_disk_caches = {}
+
+
+def _shared_cache(dtype):
+    key = np.dtype(dtype).name
+    if key not in _disk_caches:
+        _disk_caches[key] = SpectrumCache(dtype=dtype)
+    return _disk_caches[key]
+
+
+# Origin prefix of scans reopened from the catalogue rather than uploaded
+CATALOG_ORIGIN = "catalog:"
+
+# Column-header row that opens the numeric block of one sweep
+_COLUMN_HEADER = re.compile(rb'^[^\n]*(?:Pos\. \[um\]|Freq[^\n]*Amp)', re.MULTILINE)
+
+# Lookup counters for the parse caches (see DataLoader.cache_stats)
+_stats_lock = threading.Lock()
+_stats = {'lookups': 0, 'memory_misses': 0, 'pool_parsed': 0, 'disk_hits': 0}
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
+
+
 class DataLoader:
+    def __init__(self, disk_cache=True, dtype=np.float64, catalog=True):
+        """``dtype=np.float32`` opts in to single-precision spectrum storage.
+
+        Loaded spectra come back as read-only SpectrumRecords; with a disk
+        cache their arrays are memory-mapped views of the cache files.
+        Every loaded scan is also recorded in the scan catalogue.
+        """
+        self.dtype = np.dtype(dtype)
+        if disk_cache is True:
+            disk_cache = _shared_cache(self.dtype)
+        self.disk_cache = disk_cache or None
+        if catalog is True:
+            catalog = shared_catalog()
+        self.catalog = catalog if catalog is not False else None
+
     @staticmethod
     @st.cache_data(show_spinner=False, ttl=3600)
-    def load_file_content(filename, contentBytes):
-        """Helper to cache parsing logic. We pass raw bytes so it is hashable for Streamlit"""
+    def load_file_content(filename, digest, _contentBytes):
+        """Helper to cache parsing logic, keyed on (filename, digest).
+
+        The leading underscore tells Streamlit not to hash the raw bytes,
+        so a lookup costs one short string compare instead of O(size).
+        """
+        _count('memory_misses')
+        return DataLoader.parse_content(filename, _contentBytes)
+
+    @staticmethod
+    def cache_stats():
+        """Parse-cache hit/miss counts since the server started."""
+        with _stats_lock:
+            s = dict(_stats)
+        return {
+            'memory_hits': s['lookups'] - s['memory_misses'],
+            'disk_hits':   s['disk_hits'],
+            'misses':      s['memory_misses'] + s['pool_parsed'],
+        }
+
+    @staticmethod
+    def parse_content(filename, contentBytes):
+        """Parse one instrument .txt upload into a spectrum dict (uncached)."""
         try:
             content = contentBytes.decode('utf-8', errors='ignore')
         except Exception as e:
              raise ValueError(f"Could not read or decode file {filename}: {e}")
 
-        lines = content.splitlines()
+        head_lines, data_offset = DataLoader._split_header(content)
         temperature = -1.0
-        
+
         # Temp extraction
-        for line in lines[:15]:
+        for line in head_lines[:15]:
             if 'description' in line.lower():
                 m = re.search(r'(\d+(?:\.\d+)?)\s*[Kk]', line, re.IGNORECASE)
                 if m:
@@ -26,50 +107,36 @@ class DataLoader:
             m = re.search(r'(\d+(?:\.\d+)?)\s*[Kk]', filename, re.IGNORECASE)
             if m: temperature = float(m.group(1))
 
-        header_row = 15
-        for i, ln in enumerate(lines):
-            if 'Pos. [um]' in ln or ('Freq' in ln and 'Amp' in ln):
-                header_row = i + 1
-                break
-
-        data_lines = lines[header_row:]
-        rows = []
-        for ln in data_lines:
-            ln = ln.strip()
-            if not ln: continue
-            try:
-                vals = [float(x) for x in ln.split()]
-                if len(vals) >= 5:
-                    rows.append(vals)
-            except ValueError:
-                continue
+        # Bulk path first; the tolerant line parser only runs for malformed blocks
+        data_text = content[data_offset:]
+        arr = DataLoader._parse_numeric_block(data_text)
+        if arr is None:
+            arr = DataLoader._parse_rows_tolerant(data_text.splitlines())
 
-        if not rows:
+        if arr is None:
             raise ValueError(f"No valid data rows found in {filename}")
 
-        arr = np.array(rows)
-        
         # Extract start position for delay stage correction
         start_pos = 0.0
-        for line in lines[:15]:
+        for line in head_lines[:15]:
             if line.startswith('Start Position'):
-                try: 
+                try:
                     start_pos = float(line.split('Position')[1].strip())
                 except: pass
 
         time_full    = arr[:, 1].astype(float)
-        
+
         # Compensate for delay stage mechanical shift if present
         if start_pos != 0.0:
             time_full = time_full + (start_pos / 299.792458)
-            
+
         E_field_full = arr[:, 2].astype(float)
         freq         = arr[:, 3].astype(float)
         amp          = arr[:, 4].astype(float)
         amp_db       = arr[:, 5].astype(float) if arr.shape[1] >= 6 else amp.copy()
 
         mask = (freq > 0)
-        
+
         # Ensure all arrays have consistent lengths after masking
         freq_masked = freq[mask]
         amp_masked = amp[mask]
@@ -86,11 +153,368 @@ class DataLoader:
             'amp_db':      amp_db_masked,
         }
 
-    def load_file(self, file_obj):
-        # We read the bytes here so we can pass them to the cached function
+    def load_file(self, file_obj, digest=None):
+        # We read the bytes here and key the cached parse on their digest
         # file_obj is an UploadedFile, not natively hashable by Streamlit without issues
         contentBytes = file_obj.read()
-        return self.load_file_content(file_obj.name, contentBytes)
+        digest = digest or content_digest(contentBytes)
+        rec = None
+        if self.disk_cache is not None:
+            rec = self._from_disk_cache(file_obj.name, contentBytes, digest)
+        if rec is None:
+            rec = self._parse_cached(file_obj.name, digest, contentBytes)
+            rec = self._store(digest, rec)
+        self._catalogue([(file_obj.name, digest, file_obj.name, contentBytes[:8192], rec)])
+        return rec
+
+    def load_many(self, file_objs, workers=None, on_progress=None, digests=None):
+        """Load several uploads, parsing cache misses in a process pool.
+
+        Uploads may be plain .txt files, .zip archives or gzip-compressed
+        text; see ``iter_scans``. Scans are streamed into the pool with a
+        bounded number in flight, so an archive is never fully decompressed
+        in memory.
+
+        Returns ``(records, errors)``: records keep the upload order (failed
+        scans are left out) and errors are ``(name, upload, message)``
+        triples, ``upload`` being the upload the failed scan came from.
+        ``on_progress(done, total, name)`` is called as each scan finishes;
+        ``total`` is an estimate that grows if files hold several sweeps.
+        ``digests`` optionally maps upload name → precomputed content digest.
+        """
+        uploads = [(f.name, f.read()) for f in file_objs]
+        known = digests or {}
+        total = sum(self._count_members(name, raw) for name, raw in uploads)
+        records, errors = {}, {}
+        done = 0
+
+        def _finish(i, name, rec=None, err=None, origin=None):
+            nonlocal done
+            if err is None:
+                records[i] = rec
+            else:
+                errors[i] = (name, origin or name, str(err))
+            done += 1
+            if on_progress is not None:
+                on_progress(done, max(total, done), name)
+
+        heads = {}     # index -> (name, digest, origin, header bytes) for the catalogue
+        workers = workers or os.cpu_count() or 1
+        pool = None
+        use_pool = workers > 1 and total > 1
+        pending = {}   # future -> (index, name, digest, origin, raw)
+
+        def _drain(block):
+            nonlocal use_pool
+            if not pending:
+                return
+            timeout = None if block else 0
+            done_futs, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for fut in done_futs:
+                i, name, digest, origin, raw = pending.pop(fut)
+                try:
+                    rec = fut.result()
+                except BrokenProcessPool as e:
+                    # No usable process pool here — finish the rest serially
+                    if use_pool:
+                        log.warning(f"Parallel ingest unavailable ({e}); parsing serially")
+                    use_pool = False
+                    self._load_serial(i, name, digest, origin, raw, _finish)
+                    continue
+                except Exception as e:
+                    _finish(i, name, err=e, origin=origin)
+                    continue
+                _finish(i, name, self._store(digest, rec, origin))
+
+        idx = 0
+        try:
+            for origin, raw in uploads:
+                try:
+                    for name, data in self.iter_scans(origin, raw):
+                        i, idx = idx, idx + 1
+                        # A single plain file keeps the digest of the upload
+                        digest = (known.get(origin) if name == origin else None) \
+                            or content_digest(data)
+                        heads[i] = (name, digest, origin, data[:8192])
+                        if self.disk_cache is not None:
+                            rec = self._from_disk_cache(name, data, digest, origin)
+                            if rec is not None:
+                                _finish(i, name, rec)
+                                continue
+                        if use_pool and pool is None:
+                            try:
+                                pool = ProcessPoolExecutor(max_workers=min(workers, total))
+                            except OSError as e:
+                                log.warning(f"Parallel ingest unavailable ({e}); parsing serially")
+                                use_pool = False
+                        if not use_pool:
+                            self._load_serial(i, name, digest, origin, data, _finish)
+                            continue
+                        try:
+                            fut = pool.submit(DataLoader.parse_content, name, data)
+                        except (RuntimeError, OSError) as e:
+                            log.warning(f"Parallel ingest unavailable ({e}); parsing serially")
+                            use_pool = False
+                            self._load_serial(i, name, digest, origin, data, _finish)
+                            continue
+                        _count('pool_parsed')
+                        pending[fut] = (i, name, digest, origin, data)
+                        # Bound the decompressed bytes held by in-flight scans
+                        while len(pending) >= 2 * workers:
+                            _drain(block=True)
+                        _drain(block=False)
+                except (zipfile.BadZipFile, EOFError, OSError, zlib.error) as e:
+                    i, idx = idx, idx + 1
+                    _finish(i, origin, err=f"Could not read archive: {e}", origin=origin)
+            while pending:
+                _drain(block=True)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        self._catalogue([heads[i] + (records[i],) for i in sorted(records)])
+        return ([records[i] for i in sorted(records)],
+                [errors[i] for i in sorted(errors)])
+
+    def load_from_catalog(self, rows):
+        """Reopen catalogued scans straight from the disk cache.
+
+        ``rows`` come from ``ScanCatalog.query``. Returns ``(records,
+        missing)``; scans whose cache entry has been evicted (or that were
+        cached with another storage dtype) are listed in ``missing`` and
+        need to be uploaded again.
+        """
+        records, missing = [], []
+        for row in rows:
+            rec = (self.disk_cache.get(row['digest'], row['path'])
+                   if self.disk_cache is not None else None)
+            if rec is None:
+                missing.append(row['path'])
+                continue
+            rec.temperature = row['temperature']
+            rec.origin = CATALOG_ORIGIN + row['path']
+            records.append(rec)
+        return records, missing
+
+    @staticmethod
+    def iter_scans(name, contentBytes):
+        """Yield ``(scan_name, bytes)`` for every scan inside one upload.
+
+        .zip archives yield their .txt members and .gz files their
+        decompressed text, one member at a time. Files holding several
+        concatenated sweeps yield one entry per sweep, named
+        ``<file>_sweepN<ext>``. Member names are prefixed with the archive
+        name so scans from different archives never collide.
+        """
+        for member, data in DataLoader._iter_members(name, contentBytes):
+            sweeps = DataLoader._split_sweeps(data)
+            if len(sweeps) == 1:
+                yield member, data
+                continue
+            stem, ext = os.path.splitext(member)
+            for k, sweep in enumerate(sweeps, 1):
+                yield f"{stem}_sweep{k}{ext}", sweep
+
+    def _load_serial(self, i, name, digest, origin, data, finish):
+        try:
+            rec = self._parse_cached(name, digest, data)
+        except Exception as e:
+            finish(i, name, err=e, origin=origin)
+            return
+        finish(i, name, self._store(digest, rec, origin))
+
+    def _catalogue(self, entries):
+        """Record ``(name, digest, origin, head bytes, rec)`` entries in the catalogue."""
+        if self.catalog is None or not entries:
+            return
+        rows = []
+        for name, digest, origin, head, rec in entries:
+            head = head.decode('utf-8', errors='ignore')
+            rows.append((name, digest, origin, self._extract_sample(head, name), rec))
+        self.catalog.add_many(rows)
+
+    def _parse_cached(self, filename, digest, contentBytes):
+        _count('lookups')
+        return self.load_file_content(filename, digest, contentBytes)
+
+    def _from_disk_cache(self, filename, contentBytes, digest, origin=None):
+        rec = self.disk_cache.get(digest, filename)
+        if rec is not None:
+            _count('disk_hits')
+            rec.origin = origin or filename
+            # Temperature may come from the filename, so re-derive it from
+            # the header lines of this upload rather than trusting the entry
+            head = contentBytes[:8192].decode('utf-8', errors='ignore')
+            rec['temperature'] = self._extract_temperature(head, filename)
+        return rec
+
+    def _store(self, digest, rec, origin=None):
+        """Write ``rec`` to the disk cache and return its SpectrumRecord form."""
+        if self.disk_cache is not None and digest is not None:
+            stored = self.disk_cache.put(digest, rec)
+            if stored is not None:
+                stored.origin = origin or stored.filename
+                return stored
+        time_ = np.array(rec['time'], dtype=self.dtype)
+        E_field = np.array(rec['E_field'], dtype=self.dtype)
+        time_.flags.writeable = False
+        E_field.flags.writeable = False
+        return SpectrumRecord.from_columns(
+            rec['filename'], rec['temperature'], rec['freq'], rec['amp'],
+            rec['amp_db'], dtype=self.dtype, time=time_, E_field=E_field,
+            start_pos=rec['start_pos'], origin=origin)
+
+    # ── archive helpers ─────────────────────────────────────────────────────
+    @staticmethod
+    def _is_zip(name):
+        return name.lower().endswith('.zip')
+
+    @staticmethod
+    def _is_gzip(name):
+        return name.lower().endswith('.gz')
+
+    @staticmethod
+    def _count_members(name, contentBytes):
+        """Number of scans an upload is expected to hold (before sweep splitting)."""
+        if DataLoader._is_zip(name):
+            try:
+                with zipfile.ZipFile(io.BytesIO(contentBytes)) as zf:
+                    return max(1, sum(DataLoader._is_scan_member(i) for i in zf.infolist()))
+            except zipfile.BadZipFile:
+                return 1
+        return 1
+
+    @staticmethod
+    def _is_scan_member(info):
+        base = os.path.basename(info.filename)
+        return (not info.is_dir() and not info.filename.startswith('__MACOSX/')
+                and not base.startswith('.') and base.lower().endswith('.txt'))
+
+    @staticmethod
+    def _iter_members(name, contentBytes):
+        """Yield ``(member_name, bytes)``, decompressing one member at a time."""
+        if DataLoader._is_zip(name):
+            with zipfile.ZipFile(io.BytesIO(contentBytes)) as zf:
+                for info in zf.infolist():
+                    if DataLoader._is_scan_member(info):
+                        yield f"{name}/{info.filename}", zf.read(info)
+        elif DataLoader._is_gzip(name):
+            with gzip.GzipFile(fileobj=io.BytesIO(contentBytes)) as gz:
+                yield name[:-3], gz.read()
+        else:
+            yield name, contentBytes
+
+    @staticmethod
+    def _split_sweeps(contentBytes):
+        """Split a file of concatenated sweeps at each new header block.
+
+        A sweep starts at the first non-numeric line that follows the
+        previous sweep's numeric block; files with one column header are
+        returned whole.
+        """
+        heads = [m.start() for m in _COLUMN_HEADER.finditer(contentBytes)]
+        if len(heads) < 2:
+            return [contentBytes]
+        bounds = [0]
+        for h in heads[1:]:
+            # Walk back from the column header over the sweep's own header lines
+            lo, start = bounds[-1], h
+            while start > lo:
+                prev = max(lo, contentBytes.rfind(b'\n', lo, start - 1) + 1)
+                if DataLoader._is_data_row(contentBytes[prev:start]):
+                    break
+                start = prev
+            if start > lo:
+                bounds.append(start)
+        bounds.append(len(contentBytes))
+        return [contentBytes[a:b] for a, b in zip(bounds, bounds[1:])]
+
+    @staticmethod
+    def _is_data_row(line):
+        fields = line.split()
+        if len(fields) < 5:
+            return False
+        try:
+            [float(x) for x in fields]
+        except ValueError:
+            return False
+        return True
+
+    # ── parsing helpers ─────────────────────────────────────────────────────
+    @staticmethod
+    def _split_header(content, default_rows=15):
+        """Locate the column-header row without splitting the whole file.
+
+        Returns the header lines (everything up to and including the
+        column header) and the character offset where the numeric block
+        starts. Falls back to ``default_rows`` lines when no header is found.
+        """
+        head_lines = []
+        offsets = []
+        pos = 0
+        n = len(content)
+        while pos < n:
+            end = content.find('\n', pos)
+            nxt = n if end < 0 else end + 1
+            ln = content[pos:nxt].rstrip('\r\n')
+            head_lines.append(ln)
+            offsets.append(nxt)
+            if 'Pos. [um]' in ln or ('Freq' in ln and 'Amp' in ln):
+                return head_lines, nxt
+            pos = nxt
+
+        # No header row anywhere — keep the historical 15-line skip
+        if len(offsets) >= default_rows:
+            return head_lines, offsets[default_rows - 1]
+        return head_lines, n
+
+    @staticmethod
+    def _parse_numeric_block(data_text):
+        """Parse the whole numeric block in one vectorized call.
+
+        Returns ``None`` when the block is not a clean rectangular table of
+        at least 5 columns, so the caller can fall back to the tolerant parser.
+        """
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", UserWarning)  # empty block
+                arr = np.loadtxt(io.StringIO(data_text), dtype=float, ndmin=2)
+        except ValueError:
+            return None
+        if arr.size == 0 or arr.shape[1] < 5:
+            return None
+        return arr
+
+    @staticmethod
+    def _parse_rows_tolerant(data_lines):
+        """Line-by-line parser that skips blank, short and non-numeric rows."""
+        rows = []
+        for ln in data_lines:
+            ln = ln.strip()
+            if not ln: continue
+            try:
+                vals = [float(x) for x in ln.split()]
+                if len(vals) >= 5:
+                    rows.append(vals)
+            except ValueError:
+                continue
+
+        if not rows:
+            return None
+        return np.array(rows)
+
+    @staticmethod
+    def _extract_sample(content, filename):
+        """Sample name: the Description header minus its temperature token."""
+        for line in content.splitlines()[:15]:
+            if 'description' in line.lower():
+                desc = line.split(':', 1)[1] if ':' in line else line
+                desc = re.sub(r'(\d+(?:\.\d+)?)\s*[Kk]\b', '', desc).strip(' \t-_,;')
+                if desc:
+                    return ' '.join(desc.split())
+        stem = os.path.splitext(os.path.basename(filename))[0]
+        m = re.search(r'(\d+(?:\.\d+)?)\s*[Kk]', stem)
+        return stem[:m.start()].strip(' -_') if m and m.start() > 0 else stem
 
     def _extract_temperature(self, content, filename):
         for line in content.splitlines()[:15]:
@@ -99,4 +523,4 @@ class DataLoader:
                 if m: return float(m.group(1))
         m = re.search(r'(\d+(?:\.\d+)?)\s*[Kk]', filename, re.IGNORECASE)
         if m: return float(m.group(1))
-        return -1.0
\ No newline at end of file
+        return -1.0
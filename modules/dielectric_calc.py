@@ -1,7 +1,7 @@
 import numpy as np
 from scipy.fft import fft, fftfreq
-from scipy.signal import savgol_filter
 from modules.logger import get_logger
+from modules.preprocess import smooth_rows
 
 log = get_logger("thz.dielectric")
 
@@ -12,8 +12,9 @@ class DielectricCalculator:
         self.c = 0.29979  # mm/ps
 
     def calculate_all(self, ref_data, sample_list, smooth=5):
-        t_r = ref_data['time']
-        E_r = ref_data['E_field']
+        # Spectra may be stored as float32; always compute in float64
+        t_r = np.asarray(ref_data['time'], dtype=float)
+        E_r = np.asarray(ref_data['E_field'], dtype=float)
 
         if len(t_r) < 2:
             log.error("Reference data 'time' array is too short.")
@@ -45,8 +46,8 @@ class DielectricCalculator:
                         f"Skipping {fname}: insufficient time-domain data ({n_len} pts).")
                     continue
 
-                E_s_arr = s['E_field'][:n_len]
-                t_s_arr = s.get('time', [])
+                E_s_arr = np.asarray(s['E_field'][:n_len], dtype=float)
+                t_s_arr = np.asarray(s.get('time', []), dtype=float)
 
                 # 1. To prevent phase unwrapping failure (phase jumps > pi),
                 # we mathematically align the sample pulse to the reference pulse.
@@ -91,12 +92,11 @@ class DielectricCalculator:
                 n, k, e1, e2 = self._params(freq_pos, amp_H, phi_true)
 
                 if smooth > 1:
-                    for arr in [n, k, e1, e2]:
-                        if arr is not None and np.any(np.isfinite(arr)):
-                            try:
-                                arr[:] = savgol_filter(arr, int(smooth), 3)
-                            except Exception as sav_e:
-                                log.warning(f"savgol_filter failed for {fname}: {sav_e}")
+                    # n, k, ε₁, ε₂ smoothed together as one (4, n_freq) stack
+                    try:
+                        n, k, e1, e2 = smooth_rows(np.vstack([n, k, e1, e2]), int(smooth))
+                    except Exception as sav_e:
+                        log.warning(f"savgol_filter failed for {fname}: {sav_e}")
 
                 results.append({'temp': temp, 'freq': freq_pos, 'n': n, 'k': k, 'e1': e1, 'e2': e2})
 
@@ -0,0 +1,9 @@
+"""
+digest.py — fast content digests used as cache keys.
+"""
+import hashlib
+
+
+def content_digest(data: bytes) -> str:
+    """Return a short hex digest of raw file bytes (BLAKE2b, 128-bit)."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
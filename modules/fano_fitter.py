@@ -1,48 +1,282 @@
 """
-FanoFitter — replicates THzdata.py fitting logic exactly
+FanoFitter — replicates THzdata.py fitting logic exactly: the ROI stretch
+of a spectrum is outlier-repaired (against the ROI's own median step),
+Savitzky–Golay smoothed and fitted with the Fano model.
 """
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 import numpy as np
 from scipy.optimize import curve_fit
-from scipy.signal import savgol_filter
+
+from modules.digest import content_digest
+from modules.fano_kernel import FanoModel, depth_db, fano, fano_jac
+from modules.logger import get_logger
+from modules.preprocess import (OUTLIER_THRESHOLD, repair_outliers, resmooth_slice,
+                               shared_preprocessor)
+
+log = get_logger("thz.fano")
+
+# Result keys holding the fitted parameters, in curve_fit order
+PARAM_KEYS = ('Peak_Freq_THz', 'Fano_Kappa', 'Fano_Gamma', 'Fano_Phi',
+              'Baseline_k', 'Baseline_b')
+# A warm-started fit whose R² falls further than this below the previous
+# temperature's is redone from the cold guess
+WARM_R2_TOL = 0.01
+# Part of every fit-cache key; bump when the fit's outputs change
+_CACHE_VERSION = 3
+# Starting a worker process costs as much as tens of fits: batches with
+# fewer fits than this per worker are fitted in-process
+MIN_FITS_PER_WORKER = 8
 
 
 class FanoFitter:
-    def __init__(self, smooth_window=5, remove_outliers=True):
+    def __init__(self, smooth_window=5, remove_outliers=True, preprocessor=None,
+                 cache=None, maxfev=10000, model=FanoModel):
         self.smooth_window   = smooth_window if smooth_window % 2 == 1 else smooth_window + 1
         self.remove_outliers = remove_outliers
+        self.maxfev          = maxfev
+        # Outlier repair + smoothing, cached across fits and consumers
+        self.preprocessor    = (preprocessor if preprocessor is not None
+                                else shared_preprocessor())
+        # Optional FitCache of finished results (cold-start fits of raw spectra)
+        self.cache           = cache
+        # Model class, built per ROI; its ``jac`` (None: finite differences)
+        # goes to curve_fit
+        self.model           = model
 
     # ── public ──────────────────────────────────────────────────────────────
-    def fit(self, freq, amp, roi, temperature, filename):
+    def prepare(self, amps):
+        """Preprocessed copies of amplitude arrays, batched and cached.
+
+        The outlier statistic is taken over each array as given, so ``fit``
+        passes the ROI stretch (see ``roi_slice``); preparing every ROI
+        stretch of a batch first does the work as one 2-D pass.
+        """
+        thr = OUTLIER_THRESHOLD if self.remove_outliers else None
+        return self.preprocessor.rows(amps, self.smooth_window, thr)
+
+    @staticmethod
+    def roi_slice(freq, amp, roi):
+        """The points of ``amp`` whose ``freq`` lies in ``roi``, as ``fit`` sees them."""
+        freq = np.asarray(freq, dtype=float)
+        return np.asarray(amp, dtype=float)[(freq >= roi[0]) & (freq <= roi[1])]
+
+    def prepare_rois(self, spectra, rois):
+        """Prepared stretches of every spectrum in every ROI, sharing the smoothing.
+
+        Whole spectra are smoothed once, in one batched pass through the
+        shared cache, and every ROI stretch is sliced from the result. Only
+        the outlier repair, whose statistic is the ROI's own, and the
+        filter's end windows are redone per ROI (``resmooth_slice``), so
+        each stretch equals ``prepare`` of its ``roi_slice`` up to rounding.
+        Returns one ``{roi: stretch}`` dict per spectrum.
+        """
+        smoothed = self.preprocessor.rows([d['amp'] for d in spectra],
+                                          self.smooth_window, thr=None)
+        out = []
+        for d, shared in zip(spectra, smoothed):
+            freq = np.asarray(d['freq'], dtype=float)
+            amp = np.asarray(d['amp'], dtype=float)
+            stretches = {}
+            for roi in rois:
+                idx = np.flatnonzero((freq >= roi[0]) & (freq <= roi[1]))
+                raw = amp[idx]
+                if len(idx) and idx[-1] - idx[0] + 1 != len(idx):
+                    # Unsorted axis: the stretch is not one slice of the spectrum
+                    stretches[roi] = self.prepare([raw])[0]
+                    continue
+                rep = repair_outliers(raw, OUTLIER_THRESHOLD)[0] if self.remove_outliers else raw
+                stretches[roi] = resmooth_slice(shared[idx], raw, rep, self.smooth_window)
+            out.append(stretches)
+        return out
+
+    def fit_many(self, spectra, roi, workers=None, on_progress=None):
+        """Fit every spectrum of ``spectra`` in ``roi``, spread over processes.
+
+        ``spectra`` are records with ``freq``, ``amp``, ``temperature`` and
+        ``filename``. They are preprocessed here in one batched pass and
+        fitted in a process pool of ``pool_workers`` processes (serially if
+        that is one, i.e. the batch is too small to pay for the pool, or no
+        pool can be started); ``on_progress(done, total, filename)`` is
+        called as each fit completes, in completion order.
+
+        Returns ``(results, errors)``: ``results`` maps each filename, in
+        input order, to its ``fit`` output or None if the fit failed, and
+        ``errors`` maps the failed filenames to the error message. The
+        fits are the same as calling ``fit`` on each spectrum in turn.
+        With a ``cache``, spectra fitted before under the same settings
+        are read back and only the rest are preprocessed and fitted.
+        """
+        n = len(spectra)
+        done, keys = {}, {}
+
+        def _finish(k, res):
+            done[k] = res
+            if on_progress is not None:
+                on_progress(len(done), n, spectra[k]['filename'])
+
+        if self.cache is not None:
+            for k, d in enumerate(spectra):
+                keys[k] = self._cache_key(d['freq'], d['amp'], roi)
+                hit = self.cache.get(keys[k])
+                if hit is not None:
+                    _finish(k, dict(hit, Temperature_K=d['temperature'],
+                                    Filename=d['filename']))
+        todo = [k for k in range(n) if k not in done]
+        amps = self.prepare([self.roi_slice(spectra[k]['freq'], spectra[k]['amp'], roi)
+                             for k in todo])
+        jobs = {k: (np.asarray(spectra[k]['freq'], dtype=float), a, roi,
+                    spectra[k]['temperature'], spectra[k]['filename'])
+                for k, a in zip(todo, amps)}
+
+        settings = (self.smooth_window, self.maxfev, self.model)
+        workers = pool_workers(len(jobs), workers)
+        if workers > 1:
+            try:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    futs = {pool.submit(_fit_task, *job, *settings): k
+                            for k, job in jobs.items()}
+                    for fut in as_completed(futs):
+                        _finish(futs[fut], fut.result())
+            except (OSError, BrokenProcessPool) as e:
+                log.warning(f"Parallel fitting unavailable ({e}); fitting serially")
+        for k, job in jobs.items():
+            if k not in done:
+                _finish(k, _fit_task(*job, *settings))
+
+        results, errors = {}, {}
+        for k, d in enumerate(spectra):
+            res = done[k]
+            if isinstance(res, str):
+                errors[d['filename']] = res
+                res = None
+            elif k in jobs and self.cache is not None:
+                self.cache.put(keys[k], res)
+            results[d['filename']] = res
+        if self.cache is not None:
+            log.info(f"Fit cache: {n - len(jobs)} of {n} results reused, {len(jobs)} fitted")
+        return results, errors
+
+    def fit_sequence(self, spectra, roi, on_progress=None, r2_tol=WARM_R2_TOL):
+        """Fit ``spectra`` in temperature order, each seeded by the previous fit.
+
+        Neighbouring temperatures have nearly the same Fano parameters, so
+        every fit after the first starts from the last converged ones. If
+        that fit fails or its R² drops more than ``r2_tol`` below the
+        previous temperature's, the spectrum is refitted from the usual
+        cold guess and the better of the two is kept. Runs in-process, one
+        fit after another, and bypasses the fit cache (a warm result
+        depends on the fits before it); ``on_progress`` is as in
+        ``fit_many``.
+
+        Returns ``(results, errors, stats)``: ``results`` and ``errors`` as
+        from ``fit_many``, and ``stats`` one dict per spectrum in
+        temperature order with ``Temperature_K``, ``Filename``, the
+        ``Start`` that was kept (``cold``, ``warm`` or ``fallback``) and
+        ``nfev``/``ms`` of the warm and the cold attempt (NaN if not run).
+        """
+        amps = self.prepare([self.roi_slice(d['freq'], d['amp'], roi) for d in spectra])
+        order = sorted(range(len(spectra)), key=lambda k: spectra[k]['temperature'])
+        done, errors, stats = {}, {}, []
+        prev = None
+        for n, k in enumerate(order, 1):
+            d = spectra[k]
+            args = (d['freq'], amps[k], roi, d['temperature'], d['filename'])
+            row = {'Temperature_K': d['temperature'], 'Filename': d['filename'],
+                   'Start': 'cold', 'nfev_warm': np.nan, 'ms_warm': np.nan,
+                   'nfev_cold': np.nan, 'ms_cold': np.nan}
+            best = err = None
+            if prev is not None:
+                t0 = time.perf_counter()
+                try:
+                    best, row['nfev_warm'] = self._fit(
+                        *args, preprocessed=True, p0=[prev[c] for c in PARAM_KEYS])
+                    row['Start'] = 'warm'
+                except Exception as e:
+                    err = str(e)
+                row['ms_warm'] = (time.perf_counter() - t0) * 1e3
+            if best is None or best['R_squared'] < prev['R_squared'] - r2_tol:
+                t0 = time.perf_counter()
+                try:
+                    cold, row['nfev_cold'] = self._fit(*args, preprocessed=True)
+                    if best is None or cold['R_squared'] > best['R_squared']:
+                        best = cold
+                        row['Start'] = 'cold' if prev is None else 'fallback'
+                except Exception as e:
+                    err = str(e)
+                row['ms_cold'] = (time.perf_counter() - t0) * 1e3
+            if best is None:
+                errors[d['filename']] = err
+            else:
+                prev = best
+            done[k] = best
+            stats.append(row)
+            if on_progress is not None:
+                on_progress(n, len(order), d['filename'])
+
+        results = {d['filename']: done[k] for k, d in enumerate(spectra)}
+        n_warm = sum(r['Start'] == 'warm' for r in stats)
+        log.info(f"Warm-start fitting: {n_warm} warm, "
+                 f"{sum(r['Start'] == 'fallback' for r in stats)} fell back to cold, "
+                 f"{len(errors)} failed")
+        return results, errors, stats
+
+    def fit(self, freq, amp, roi, temperature, filename, preprocessed=False, p0=None):
+        """Fit one spectrum in ``roi``.
+
+        With ``preprocessed``, ``amp`` is already the prepared ROI stretch
+        (``prepare`` of ``roi_slice``) rather than the whole raw spectrum.
+        ``p0`` replaces the cold initial guess (clipped into the bounds).
+        Cold fits of raw spectra go through the ``cache`` when there is one.
+        """
+        use_cache = self.cache is not None and p0 is None and not preprocessed
+        if use_cache:
+            key = self._cache_key(freq, amp, roi)
+            hit = self.cache.get(key)
+            if hit is not None:
+                return dict(hit, Temperature_K=temperature, Filename=filename)
+        res = self._fit(freq, amp, roi, temperature, filename, preprocessed, p0)[0]
+        if use_cache:
+            self.cache.put(key, res)
+        return res
+
+    # ── private ─────────────────────────────────────────────────────────────
+    def _fit(self, freq, amp, roi, temperature, filename, preprocessed=False, p0=None):
+        """``fit``, also returning the number of model evaluations it took."""
+        freq = np.asarray(freq, dtype=float)
         f1, f2 = roi
         mask = (freq >= f1) & (freq <= f2)
         f_roi = freq[mask]
-        a_roi = amp[mask].copy()
 
         if len(f_roi) < 10:
             raise ValueError("ROI too narrow (<10 pts)")
 
-        # outlier removal
-        if self.remove_outliers:
-            a_roi = self._remove_outliers(a_roi)
-
-        # smoothing
-        if self.smooth_window > 1 and len(a_roi) > self.smooth_window:
-            try:
-                a_roi = savgol_filter(a_roi, self.smooth_window, 3)
-            except Exception:
-                pass
+        # outlier removal + smoothing, on the ROI stretch only
+        if preprocessed:
+            a_roi = np.asarray(amp, dtype=float)
+        else:
+            a_roi = self.prepare([np.asarray(amp, dtype=float)[mask]])[0]
+        if len(a_roi) != len(f_roi):
+            raise ValueError("Preprocessed amplitudes do not match the ROI")
 
         # initial guesses
         k_g = (a_roi[-1] - a_roi[0]) / (f_roi[-1] - f_roi[0])
         b_g = a_roi[0] - k_g * f_roi[0]
         fr_g = f_roi[np.argmin(a_roi)]
 
-        p0     = [fr_g, 0.1, 0.1, 0.0, k_g, b_g]
-        bounds = ([f_roi[0], 0, 0, -np.pi, -np.inf, -np.inf],
-                  [f_roi[-1], np.inf, np.inf,  np.pi,  np.inf,  np.inf])
+        bounds = self._bounds(f_roi)
+        if p0 is None:
+            p0 = [fr_g, 0.1, 0.1, 0.0, k_g, b_g]
+        else:
+            p0 = np.clip(np.asarray(p0, dtype=float), *bounds)
 
-        popt, _ = curve_fit(self._fano, f_roi, a_roi, p0=p0,
-                            bounds=bounds, maxfev=10000)
+        # Real-valued model and Jacobian writing into buffers sized for this ROI
+        model = self.model(f_roi)
+        popt, _, info, _, _ = curve_fit(model, f_roi, a_roi, p0=p0, bounds=bounds,
+                                        maxfev=self.maxfev, jac=model.jac,
+                                        full_output=True)
         fr, kappa, gamma, phi, k_b, b_b = popt
 
         # ── derived quantities ────────────────────────────────────────────
@@ -98,27 +332,53 @@ class FanoFitter:
             'left_x':         float(left_x),
             'right_x':        float(right_x),
             'peak_x':         float(peak_x),
-        }
+        }, int(info['nfev'])
+
+    @staticmethod
+    def _bounds(f_roi):
+        return ([float(f_roi[0]), 0.0, 0.0, -np.pi, -np.inf, -np.inf],
+                [float(f_roi[-1]), np.inf, np.inf, np.pi, np.inf, np.inf])
+
+    def _cache_key(self, freq, amp, roi):
+        """Digest of a raw spectrum and every setting its fit depends on."""
+        freq = np.ascontiguousarray(freq, dtype=float)
+        amp = np.ascontiguousarray(amp, dtype=float)
+        lo, hi = float(roi[0]), float(roi[1])
+        f_roi = freq[(freq >= lo) & (freq <= hi)]
+        settings = (lo, hi, self.smooth_window, bool(self.remove_outliers),
+                    OUTLIER_THRESHOLD, self._bounds(f_roi) if len(f_roi) else None,
+                    self.maxfev, f"{self.model.__module__}.{self.model.__qualname__}",
+                    _CACHE_VERSION)
+        return content_digest(freq.tobytes() + amp.tobytes() + repr(settings).encode())
 
-    # ── private ─────────────────────────────────────────────────────────────
     @staticmethod
     def _fano(f, fr, kappa, gamma, phi, k_b, b_b):
-        denom = -1j * (f - fr) + (gamma + kappa) / 2.0
-        term  = 1.0 - kappa * np.exp(1j * phi) / denom
-        return (k_b * f + b_b) * np.abs(term) ** 2
+        return fano(f, fr, kappa, gamma, phi, k_b, b_b)
 
     @staticmethod
-    def _depth_dB(kappa, gamma, phi):
-        denom = (gamma + kappa) / 2.0
-        term  = 1.0 - kappa * np.exp(1j * phi) / denom
-        return float(10 * np.log10(np.abs(term) ** 2))
+    def _fano_jac(f, fr, kappa, gamma, phi, k_b, b_b):
+        """∂_fano/∂(fr, kappa, gamma, phi, k_b, b_b), shape (len(f), 6)."""
+        return fano_jac(f, fr, kappa, gamma, phi, k_b, b_b)
 
     @staticmethod
-    def _remove_outliers(data, thr=5.0):
-        out = data.copy()
-        diff = np.abs(np.diff(out))
-        med  = np.median(diff)
-        for idx in np.where(diff > med * thr)[0]:
-            if 0 < idx < len(out) - 1:
-                out[idx] = (out[idx-1] + out[idx+1]) / 2.0
-        return out
+    def _depth_dB(kappa, gamma, phi):
+        return depth_db(kappa, gamma, phi)
+
+
+def pool_workers(n_fits, workers=None):
+    """Worker processes worth starting for ``n_fits`` fits (1: fit in-process).
+
+    At most ``workers`` (default: the CPU count), and no more than leave
+    every worker ``MIN_FITS_PER_WORKER`` fits.
+    """
+    workers = workers or os.cpu_count() or 1
+    return max(1, min(workers, n_fits // MIN_FITS_PER_WORKER))
+
+
+def _fit_task(freq, amp, roi, temperature, filename, smooth_window, maxfev, model):
+    """Pool task: fit one preprocessed ROI stretch; a failure comes back as its message."""
+    try:
+        return FanoFitter(smooth_window=smooth_window, maxfev=maxfev, model=model).fit(
+            freq, amp, roi, temperature, filename, preprocessed=True)
+    except Exception as e:
+        return str(e)
@@ -0,0 +1,177 @@
+"""
+fano_kernel.py — real-valued Fano and BCS model kernels.
+
+The Fano transmission |1 − κe^{iφ}/(−i(f − f_r) + (γ + κ)/2)|² expands, with
+x = f − f_r and s = (γ + κ)/2, to the real expression
+
+    |T|² = 1 + G/q,   G = κ·(κ − 2s·cos φ + 2x·sin φ),   q = s² + x²
+
+so the model, its Jacobian and the resonance depth need no complex arrays.
+``FanoModel`` evaluates them over one ROI into buffers allocated once per
+fit. When Numba is installed the per-point loops are compiled; otherwise
+the same formulas run as in-place NumPy ufuncs.
+"""
+import math
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+HAVE_NUMBA = numba is not None
+
+
+# ── public ──────────────────────────────────────────────────────────────────
+class FanoModel:
+    """Fano model and Jacobian over one frequency axis, for ``curve_fit``.
+
+    ``model(f, *p)`` returns an internal buffer that the next call
+    overwrites (``curve_fit`` subtracts the data straight away);
+    ``model.jac(f, *p)`` returns a new ``(len(f), 6)`` array, since the
+    solver keeps it across iterations.
+    """
+
+    def __init__(self, f):
+        n = len(f)
+        self._out = np.empty(n)
+        self._x   = np.empty(n)
+        self._q   = np.empty(n)
+        self._r   = np.empty(n)
+        self._w   = np.empty(n)
+
+    def __call__(self, f, fr, kappa, gamma, phi, k_b, b_b):
+        if HAVE_NUMBA:
+            _fano_loop(f, fr, kappa, gamma, phi, k_b, b_b, self._out)
+            return self._out
+        r = self._ratio(f, fr, kappa, gamma, phi)
+        out = np.multiply(f, k_b, out=self._out)
+        out += b_b
+        r += 1.0                                    # r is |T|² from here on
+        out *= r
+        return out
+
+    def jac(self, f, fr, kappa, gamma, phi, k_b, b_b):
+        """∂model/∂(fr, kappa, gamma, phi, k_b, b_b)."""
+        if HAVE_NUMBA:
+            jac = np.empty((len(f), 6))
+            _jac_loop(f, fr, kappa, gamma, phi, k_b, b_b, jac)
+            return jac
+        s = (gamma + kappa) / 2.0
+        c, sn = math.cos(phi), math.sin(phi)
+        r = self._ratio(f, fr, kappa, gamma, phi)
+        x, w = self._x, self._w
+        # w = (k_b·f + b_b)/q; every shape column is (∂G − r·∂q)·w
+        np.multiply(f, k_b, out=w)
+        w += b_b
+        w /= self._q
+        col = np.empty((6, len(f)))                 # one contiguous row per column
+        np.multiply(r, 2.0 * x, out=col[0])         # fr:    ∂G = −2κ sin φ, ∂q = −2x
+        col[0] -= 2.0 * kappa * sn
+        np.multiply(r, -s, out=col[2])              # gamma: ∂G = −κ cos φ,  ∂q = s
+        col[2] -= kappa * c
+        np.multiply(x, 2.0 * sn, out=col[1])        # kappa: ∂G = 2κ − (2s + κ)cos φ + 2x sin φ
+        col[1] += col[2]                            #        ∂q = s (col[2] + κ cos φ = −r·s)
+        col[1] += 2.0 * (kappa - s * c)
+        np.multiply(x, 2.0 * kappa * c, out=col[3])  # phi:  ∂G = 2κ(s sin φ + x cos φ)
+        col[3] += 2.0 * kappa * s * sn
+        col[:4] *= w
+        r += 1.0
+        np.multiply(f, r, out=col[4])
+        col[5] = r
+        return col.T
+
+    # ── private ─────────────────────────────────────────────────────────────
+    def _ratio(self, f, fr, kappa, gamma, phi):
+        """G/q (= |T|² − 1) into ``_r``; leaves x and q in their buffers."""
+        s = (gamma + kappa) / 2.0
+        x = np.subtract(f, fr, out=self._x)
+        q = np.multiply(x, x, out=self._q)
+        q += s * s
+        r = np.multiply(x, 2.0 * kappa * math.sin(phi), out=self._r)
+        r += kappa * (kappa - 2.0 * s * math.cos(phi))
+        r /= q
+        return r
+
+
+def fano(f, fr, kappa, gamma, phi, k_b, b_b):
+    """Fano model on ``f`` (a new array)."""
+    f = np.asarray(f, dtype=float)
+    return FanoModel(f)(f, fr, kappa, gamma, phi, k_b, b_b)
+
+
+def fano_jac(f, fr, kappa, gamma, phi, k_b, b_b):
+    """Jacobian of ``fano`` with respect to its six parameters."""
+    f = np.asarray(f, dtype=float)
+    return FanoModel(f).jac(f, fr, kappa, gamma, phi, k_b, b_b)
+
+
+def depth_db(kappa, gamma, phi):
+    """|T|² at resonance (x = 0) in dB: 10·log10(1 + κ(κ − 2s·cos φ)/s²)."""
+    s = (gamma + kappa) / 2.0
+    if s == 0:
+        return float('nan')
+    t2 = 1.0 + kappa * (kappa - 2.0 * s * math.cos(phi)) / (s * s)
+    return 10.0 * math.log10(t2) if t2 > 0 else float('-inf')
+
+
+def bcs(T, amp, Tc, beta, out=None):
+    """A·tanh(β·√max(0, Tc/T − 1)); zero at and above Tc, without masking."""
+    T = np.asarray(T, dtype=float)
+    if out is None:
+        out = np.empty(T.shape)
+    if HAVE_NUMBA and T.ndim == 1:
+        _bcs_loop(T, amp, Tc, beta, out)
+        return out
+    np.divide(Tc, T, out=out)
+    out -= 1.0
+    np.maximum(out, 0.0, out=out)
+    np.sqrt(out, out=out)
+    out *= beta
+    np.tanh(out, out=out)
+    out *= amp
+    return out
+
+
+# ── private ─────────────────────────────────────────────────────────────────
+# Per-point loops, compiled by Numba when it is installed
+def _fano_loop(f, fr, kappa, gamma, phi, k_b, b_b, out):
+    s = 0.5 * (gamma + kappa)
+    a = kappa * (kappa - 2.0 * s * math.cos(phi))
+    b = 2.0 * kappa * math.sin(phi)
+    for i in range(f.shape[0]):
+        x = f[i] - fr
+        out[i] = (k_b * f[i] + b_b) * (1.0 + (a + b * x) / (x * x + s * s))
+
+
+def _jac_loop(f, fr, kappa, gamma, phi, k_b, b_b, jac):
+    s = 0.5 * (gamma + kappa)
+    c, sn = math.cos(phi), math.sin(phi)
+    a = kappa * (kappa - 2.0 * s * c)
+    b = 2.0 * kappa * sn
+    dk = 2.0 * kappa - (2.0 * s + kappa) * c
+    for i in range(f.shape[0]):
+        x = f[i] - fr
+        q = x * x + s * s
+        r = (a + b * x) / q
+        w = (k_b * f[i] + b_b) / q
+        jac[i, 0] = (2.0 * r * x - b) * w
+        jac[i, 1] = (dk + 2.0 * x * sn - r * s) * w
+        jac[i, 2] = (-kappa * c - r * s) * w
+        jac[i, 3] = 2.0 * kappa * (s * sn + x * c) * w
+        jac[i, 4] = f[i] * (1.0 + r)
+        jac[i, 5] = 1.0 + r
+
+
+def _bcs_loop(T, amp, Tc, beta, out):
+    for i in range(T.shape[0]):
+        v = Tc / T[i] - 1.0
+        out[i] = amp * math.tanh(beta * math.sqrt(v)) if v > 0.0 else 0.0
+
+
+if HAVE_NUMBA:
+    # error_model='numpy': division by zero gives inf/nan as in the NumPy path
+    _jit = numba.njit(cache=True, error_model='numpy')
+    _fano_loop = _jit(_fano_loop)
+    _jac_loop  = _jit(_jac_loop)
+    _bcs_loop  = _jit(_bcs_loop)
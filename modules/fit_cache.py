@@ -0,0 +1,152 @@
+"""
+fit_cache.py — persistent on-disk cache of Fano fit results.
+
+One uncompressed .npz file per fit, named after a digest of everything the
+fit depends on: the spectrum itself and the fit settings (ROI, smoothing
+window, outlier flag, parameter bounds, evaluation budget). Re-running an
+unchanged batch — after a rerun, a session reload or a restart — reads the
+results back instead of refitting, and a changed spectrum misses only its
+own entry. The cache is capped in size and evicts the least recently used
+entries first.
+"""
+import json
+import os
+import threading
+import numpy as np
+
+from modules.logger import get_logger
+
+log = get_logger("thz.fitcache")
+
+CACHE_DIR = os.path.join("cache", "fits")
+
+# Scalar results share one JSON member (exact float round trip); arrays
+# are stored as their own members
+_SCALARS = '__scalars__'
+
+
+class FitCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=128 * 1024 ** 2):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._total    = None          # bytes on disk, scanned on first put
+        self._lock     = threading.Lock()
+        self.hits = self.misses = 0
+
+    # ── public ──────────────────────────────────────────────────────────────
+    def get(self, key):
+        """Return the cached fit result for ``key`` or ``None``."""
+        path = self._path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as z:
+                res = json.loads(z[_SCALARS].item())
+                res.update((k, z[k]) for k in z.files if k != _SCALARS)
+        except Exception as e:
+            log.warning(f"Dropping unreadable fit cache entry {key}: {e}")
+            self._remove(path)
+            self.misses += 1
+            return None
+        # Touch so eviction sees this entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return res
+
+    def put(self, key, result):
+        """Store one ``FanoFitter.fit`` result under ``key``; False if it failed."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp  = path + f".{os.getpid()}.{threading.get_ident()}.tmp"
+        arrays  = {k: v for k, v in result.items() if isinstance(v, np.ndarray)}
+        scalars = {k: (v.item() if isinstance(v, np.generic) else v)
+                   for k, v in result.items() if k not in arrays}
+        try:
+            arrays[_SCALARS] = np.asarray(json.dumps(scalars))
+            with open(tmp, 'wb') as fh:
+                np.savez(fh, **arrays)
+            os.replace(tmp, path)
+            size = os.path.getsize(path)
+        except (OSError, TypeError, ValueError) as e:
+            log.warning(f"Could not write fit cache entry {key}: {e}")
+            self._remove(tmp)
+            return False
+        with self._lock:
+            if self._total is None:
+                self._total = self._disk_usage()
+            else:
+                self._total += size
+            over = self._total > self.max_bytes
+        if over:
+            self.evict()
+        return True
+
+    def evict(self):
+        """Delete least-recently-used entries until the cache fits ``max_bytes``."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.npz'):
+                continue
+            p = os.path.join(self.cache_dir, name)
+            try:
+                info = os.stat(p)
+            except OSError:
+                continue
+            entries.append((info.st_mtime, info.st_size, p))
+
+        total = sum(e[1] for e in entries)
+        entries.sort()
+        for _, size, p in entries:
+            if total <= self.max_bytes:
+                break
+            if self._remove(p):
+                total -= size
+        with self._lock:
+            self._total = total
+
+    def clear(self):
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                self._remove(os.path.join(self.cache_dir, name))
+        with self._lock:
+            self._total = 0
+
+    # ── private ─────────────────────────────────────────────────────────────
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def _disk_usage(self):
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            try:
+                total += os.path.getsize(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+        return total
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_fit_cache():
+    """Process-wide FitCache used by the app's batch fitting."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = FitCache()
+        return _shared
@@ -0,0 +1,197 @@
+"""
+mode_grouping.py — dip detection for the Mode Grouping tab.
+
+Dips are found in every row of a SpectrumStack with ``find_peaks`` on the
+inverted, smoothed amplitude. Results are memoised per row under
+``(row key, search range, smoothing, prominence)`` in a bounded LRU, so
+reruns that only regroup or rerank the dips (tolerance, max groups, other
+tabs) never repeat the search, and a changed file only re-searches its
+own row.
+
+The dips then form a columnar table (one array per field) that is
+grouped either by chaining sorted frequencies (``cluster_by_frequency``)
+or by tracking each dip across neighbouring temperatures with an optimal
+assignment (``track_modes``), so a mode that softens with temperature
+stays one group. Group statistics are segment reductions
+(``np.add.reduceat``) over the table sorted by label.
+"""
+import threading
+from collections import OrderedDict
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.signal import find_peaks
+
+from modules.logger import get_logger
+
+log = get_logger("thz.modes")
+
+_EMPTY = (np.array([]), np.array([]), np.array([]))
+
+
+class DipFinder:
+    def __init__(self, max_rows=4096):
+        self.max_rows = max_rows
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    # ── public ──────────────────────────────────────────────────────────────
+    def find(self, stack, lo, hi, smooth, prominence):
+        """Dips of every stack row in ``[lo, hi]``.
+
+        Returns one ``(dip_freq, dip_amp, prominence)`` array triple per
+        row, in stack (temperature) order. Only rows missing from the cache
+        are smoothed and searched.
+        """
+        keys = [(rk, float(lo), float(hi), int(smooth), float(prominence))
+                for rk in stack.row_keys]
+        out = [None] * len(keys)
+        with self._lock:
+            for i, k in enumerate(keys):
+                hit = self._cache.get(k)
+                if hit is not None:
+                    self._cache.move_to_end(k)
+                    out[i] = hit
+        missing = [i for i, o in enumerate(out) if o is None]
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        if not missing:
+            return out
+
+        freq, raw = stack.window(lo, hi)
+        # Windows too short for Savitzky–Golay use a moving average here, as
+        # the dip search always did
+        _, smoothed = stack.smoothed(smooth, lo, hi, moving_average=True)
+        for i in missing:
+            out[i] = _row_dips(freq, raw[i], smoothed[i], prominence)
+        with self._lock:
+            for i in missing:
+                self._cache[keys[i]] = out[i]
+            while len(self._cache) > self.max_rows:
+                self._cache.popitem(last=False)
+        log.info(f"Dip search: {len(missing)} of {len(keys)} rows searched, "
+                 f"{len(keys) - len(missing)} cached")
+        return out
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def __len__(self):
+        return len(self._cache)
+
+
+def dip_table(row_dips, temperatures):
+    """Columnar dip table from ``DipFinder.find`` output, ordered by row.
+
+    Returns a dict of equal-length arrays: ``row``, ``temperature``,
+    ``freq``, ``amp`` and ``prominence``.
+    """
+    counts = np.array([len(f) for f, _, _ in row_dips], dtype=int)
+    row = np.repeat(np.arange(len(row_dips)), counts)
+    cols = [np.concatenate([np.asarray(d[c], dtype=float) for d in row_dips])
+            if row_dips else np.array([]) for c in range(3)]
+    return {
+        'row':         row,
+        'temperature': np.asarray(temperatures, dtype=float)[row],
+        'freq':        cols[0],
+        'amp':         cols[1],
+        'prominence':  cols[2],
+    }
+
+
+def cluster_by_frequency(freq, tol):
+    """Labels from chaining sorted frequencies: a gap > ``tol`` opens a group."""
+    order = np.argsort(freq, kind='stable')
+    opens = np.zeros(len(freq), dtype=int)
+    opens[1:] = np.diff(freq[order]) > tol
+    labels = np.empty(len(freq), dtype=int)
+    labels[order] = np.cumsum(opens)
+    return labels
+
+
+def track_modes(table, tol, max_gap=3):
+    """Labels from linking dips across neighbouring temperatures.
+
+    Rows are visited in temperature order. Each row's dips are matched to
+    the open tracks (last seen at most ``max_gap`` rows earlier) by
+    ``linear_sum_assignment`` on the distance from each track's predicted
+    frequency — its last dip carried on at its last per-row drift, which
+    keeps crossing modes apart. Matches further than ``tol`` are refused
+    and those dips open new tracks.
+    """
+    rows, freq = table['row'], table['freq']
+    labels = np.full(len(freq), -1, dtype=int)
+    if not len(freq):
+        return labels
+    last_f, last_row, drift = [], [], []           # per track
+    bounds = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1], True])
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        r = rows[a]
+        idx = np.arange(a, b)
+        open_ = np.flatnonzero(np.asarray(last_row) >= r - 1 - max_gap) \
+            if last_row else np.array([], dtype=int)
+        if len(open_):
+            gap = r - np.asarray(last_row)[open_]
+            pred = np.asarray(last_f)[open_] + np.asarray(drift)[open_] * gap
+            jump = np.abs(freq[idx][:, None] - pred[None, :])
+            ri, ci = linear_sum_assignment(np.where(jump > tol, 1e6 + jump, jump))
+            ok = jump[ri, ci] <= tol
+            labels[idx[ri[ok]]] = open_[ci[ok]]
+        for i in idx:
+            k = labels[i]
+            if k < 0:
+                labels[i] = len(last_f)
+                last_f.append(freq[i]); last_row.append(r); drift.append(0.0)
+            else:
+                drift[k] = (freq[i] - last_f[k]) / (r - last_row[k])
+                last_f[k] = freq[i]; last_row[k] = r
+    return labels
+
+
+def group_stats(table, labels):
+    """Per-group statistics as arrays, one entry per distinct label.
+
+    ``center``/``std`` (population) and ``min_freq``/``max_freq`` of the dip
+    frequencies, ``t_min``/``t_max``, dip ``count`` and ``total_prom``.
+    """
+    order = np.argsort(labels, kind='stable')
+    lab = labels[order]
+    starts = np.flatnonzero(np.r_[True, lab[1:] != lab[:-1]])
+    count = np.diff(np.r_[starts, len(lab)])
+    f = table['freq'][order]
+    t = table['temperature'][order]
+    center = np.add.reduceat(f, starts) / count
+    dev = f - np.repeat(center, count)
+    return {
+        'label':      lab[starts],
+        'center':     center,
+        'std':        np.sqrt(np.add.reduceat(dev * dev, starts) / count),
+        'count':      count,
+        'min_freq':   np.minimum.reduceat(f, starts),
+        'max_freq':   np.maximum.reduceat(f, starts),
+        't_min':      np.minimum.reduceat(t, starts),
+        't_max':      np.maximum.reduceat(t, starts),
+        'total_prom': np.add.reduceat(table['prominence'][order], starts),
+    }
+
+
+def top_groups(stats, n):
+    """Indices of the ``n`` groups with the largest total prominence, by centre."""
+    top = np.argsort(-stats['total_prom'], kind='stable')[:n]
+    return top[np.argsort(stats['center'][top], kind='stable')]
+
+
+# ── private ─────────────────────────────────────────────────────────────────
+def _row_dips(freq, raw, smoothed, prominence):
+    """``(dip_freq, dip_amp, prominence)`` of one row; NaN points are skipped."""
+    ok = np.isfinite(raw)
+    if ok.sum() < 10:
+        return _EMPTY
+    f_row, amp_s, amp_sm = freq[ok], raw[ok], smoothed[ok]
+
+    # Invert to find dips
+    inverted = -amp_sm + np.max(amp_sm)
+    peaks, props = find_peaks(inverted, width=3,
+                              prominence=np.max(inverted) * prominence)
+    return f_row[peaks], amp_s[peaks], props['prominences']
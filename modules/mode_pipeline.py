@@ -0,0 +1,117 @@
+"""
+mode_pipeline.py — Fano and BCS fits for every detected mode in one job.
+
+Each mode found in the Mode Grouping tab brings its own ROI. Instead of
+selecting the modes one by one and refitting, ``fit_all_modes`` fits every
+spectrum in every ROI and then fits the BCS model to each mode's depth and
+area. Preprocessing is shared across modes: each spectrum is smoothed
+once before the fan-out and its ROI stretches are sliced from that
+(``FanoFitter.prepare_rois``; only the outlier repair, which uses each
+ROI's own statistic, is per ROI). Each pool task then fits one spectrum's
+stretches in all ROIs, so a spectrum crosses the process boundary once.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import pandas as pd
+
+from modules.bcs_analyzer import BCSAnalyzer
+from modules.fano_fitter import FanoFitter, pool_workers
+from modules.logger import get_logger
+
+log = get_logger("thz.pipeline")
+
+# Scalar Fano outputs kept in the mode table (plot arrays are dropped)
+FIT_COLUMNS = ('Temperature_K', 'Filename', 'Peak_Freq_THz', 'Fano_Kappa',
+               'Fano_Gamma', 'Fano_Phi', 'Depth_dB', 'Linear_Depth', 'FWHM_THz',
+               'Area', 'Baseline_k', 'Baseline_b', 'R_squared')
+
+
+def fit_all_modes(records, modes, smooth_window=5, remove_outliers=True,
+                  tc_fixed=None, workers=None, on_progress=None):
+    """Fano-fit ``records`` in every mode's ROI, then BCS-fit each mode.
+
+    ``modes`` maps a mode id to its ROI ``(lo, hi)``. ``on_progress(done,
+    total)`` is called as each spectrum finishes.
+
+    Returns ``(fits, bcs, errors)``: ``fits`` is a DataFrame indexed by
+    ``(Mode, Filename)`` with the scalar Fano results, ``bcs`` has one row
+    per mode with the BCS parameters of its depth and area, and ``errors``
+    lists ``(mode, filename, message)`` for failed fits.
+    """
+    fitter = FanoFitter(smooth_window=smooth_window, remove_outliers=remove_outliers)
+    rois = {m: (float(lo), float(hi)) for m, (lo, hi) in modes.items()}
+    prepared = fitter.prepare_rois(records, set(rois.values()))
+    jobs = [(d['freq'], {m: prepared[k][roi] for m, roi in rois.items()},
+             d['temperature'], d['filename']) for k, d in enumerate(records)]
+
+    done = {}
+
+    def _finish(k, res):
+        done[k] = res
+        if on_progress is not None:
+            on_progress(len(done), len(jobs))
+
+    # Same rule as FanoFitter.fit_many, counting every spectrum × ROI fit;
+    # a task is one spectrum, so never more workers than spectra
+    workers = min(pool_workers(len(jobs) * len(rois), workers), len(jobs))
+    if workers > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futs = {pool.submit(_fit_spectrum, *job, rois): k
+                        for k, job in enumerate(jobs)}
+                for fut in as_completed(futs):
+                    _finish(futs[fut], fut.result())
+        except (OSError, BrokenProcessPool) as e:
+            log.warning(f"Parallel mode fitting unavailable ({e}); fitting serially")
+    for k, job in enumerate(jobs):
+        if k not in done:
+            _finish(k, _fit_spectrum(*job, rois))
+
+    rows, errors = [], []
+    for k in range(len(jobs)):
+        for mode, res in done[k]:
+            if isinstance(res, str):
+                errors.append((mode, jobs[k][3], res))
+            else:
+                rows.append(dict(res, Mode=mode))
+    fits = pd.DataFrame(rows, columns=('Mode',) + FIT_COLUMNS)
+    fits = fits.sort_values(['Mode', 'Temperature_K']).set_index(['Mode', 'Filename'])
+
+    bcs = _fit_bcs(fits, rois, tc_fixed)
+    log.info(f"Mode batch: {len(rois)} modes × {len(jobs)} spectra, "
+             f"{len(fits)} fits, {len(errors)} failed")
+    return fits, bcs, errors
+
+
+# ── private ─────────────────────────────────────────────────────────────────
+def _fit_spectrum(freq, stretches, temperature, filename, rois):
+    """Pool task: one spectrum's prepared ROI stretches fitted in every ROI."""
+    fitter = FanoFitter()
+    out = []
+    for mode, roi in rois.items():
+        try:
+            r = fitter.fit(freq, stretches[mode], roi, temperature, filename,
+                           preprocessed=True)
+            out.append((mode, {c: r[c] for c in FIT_COLUMNS}))
+        except Exception as e:
+            out.append((mode, str(e)))
+    return out
+
+
+def _fit_bcs(fits, rois, tc_fixed):
+    bcs = BCSAnalyzer(tc_fixed=tc_fixed)
+    rows = []
+    for mode, (lo, hi) in rois.items():
+        row = {'Mode': mode, 'ROI_lo_THz': lo, 'ROI_hi_THz': hi, 'n_fits': 0}
+        if mode in fits.index.get_level_values('Mode'):
+            sub = fits.loc[mode]
+            row['n_fits'] = len(sub)
+            row['Peak_Freq_THz'] = float(sub['Peak_Freq_THz'].median())
+            T = sub['Temperature_K'].values.astype(float)
+            for col, tag in (('Linear_Depth', 'depth'), ('Area', 'area')):
+                p = bcs.fit(T, sub[col].values.astype(float))
+                A, Tc, beta = p if p else (np.nan, np.nan, np.nan)
+                row.update({f'Tc_{tag}_K': Tc, f'beta_{tag}': beta, f'A_{tag}': A})
+        rows.append(row)
+    return pd.DataFrame(rows).set_index('Mode')
@@ -0,0 +1,95 @@
+"""
+peak_metrics.py — model-free dip metrics for a quick look before fitting.
+
+Peak frequency, linear depth, FWHM and area are otherwise only known once
+``FanoFitter.fit`` has run for every file. Here they are read straight off
+the preprocessed ROI matrix of a SpectrumStack, every temperature in one
+vectorised pass, with the baseline drawn through the ROI end points
+instead of the fitted linear background. The numbers follow the fit's own
+definitions (signal = baseline − amplitude, FWHM between the outermost
+points above half depth, trapezoidal area), so the trend they show is the
+one the fits will confirm.
+"""
+import numpy as np
+import pandas as pd
+
+from modules.fano_fitter import FanoFitter
+
+_trapezoid = getattr(np, 'trapezoid', None) or np.trapz
+
+# Same names as the FanoFitter results, so previews and fits share plots
+PREVIEW_COLUMNS = ('Temperature_K', 'Filename', 'Peak_Freq_THz',
+                   'Linear_Depth', 'FWHM_THz', 'Area')
+
+
+# ── public ──────────────────────────────────────────────────────────────────
+def peak_metrics(freq, block):
+    """Dip metrics of every row of ``block`` (rows × ``freq``), all at once.
+
+    The baseline of each row is the straight line through its first and
+    last finite points; NaN points (outside a row's native range) are
+    ignored. Returns a dict of per-row arrays: ``peak_freq``, ``depth``,
+    ``fwhm``, ``area``, ``left`` and ``right`` (half-depth crossings).
+    Rows with fewer than 3 finite points are NaN throughout.
+    """
+    freq = np.asarray(freq, dtype=float)
+    y = np.array(block, dtype=float, ndmin=2)
+    n_rows, n = y.shape
+    nan = np.full(n_rows, np.nan)
+    if not n_rows or n < 3:
+        return {k: nan.copy() for k in
+                ('peak_freq', 'depth', 'fwhm', 'area', 'left', 'right')}
+
+    ok = np.isfinite(y)
+    rows = np.arange(n_rows)
+    first = np.argmax(ok, axis=1)
+    last = n - 1 - np.argmax(ok[:, ::-1], axis=1)
+    f0, f1 = freq[first], freq[last]
+    y0, y1 = y[rows, first], y[rows, last]
+    span = f1 - f0
+    slope = np.divide(y1 - y0, span, out=np.zeros(n_rows), where=span > 0)
+
+    signal = y0[:, None] + slope[:, None] * (freq - f0[:, None]) - y
+    peak = np.argmax(np.where(ok, signal, -np.inf), axis=1)
+    depth = signal[rows, peak]
+
+    above = ok & (signal >= depth[:, None] / 2.0)
+    left = np.argmax(above, axis=1)
+    right = n - 1 - np.argmax(above[:, ::-1], axis=1)
+    fwhm = np.where(right > left, freq[right] - freq[left], np.nan)
+    area = _trapezoid(np.where(ok, signal, 0.0), freq, axis=1)
+
+    valid = ok.sum(axis=1) >= 3
+    out = {
+        'peak_freq': freq[peak],
+        'depth':     depth,
+        'fwhm':      fwhm,
+        'area':      area,
+        'left':      freq[left],
+        'right':     freq[right],
+    }
+    return {k: np.where(valid, v, np.nan) for k, v in out.items()}
+
+
+def roi_preview(stack, roi, smooth_window=5, remove_outliers=True):
+    """Model-free metrics of every stack row in ``roi``, as a DataFrame.
+
+    Rows are windowed to ``roi`` and preprocessed exactly as
+    ``FanoFitter.fit`` does it (through the same cache). One row per
+    temperature, columns ``PREVIEW_COLUMNS``.
+    """
+    lo, hi = roi
+    mask = (stack.freq >= lo) & (stack.freq <= hi)
+    if not stack.n_temps or not mask.any():
+        return pd.DataFrame(columns=PREVIEW_COLUMNS)
+    fitter = FanoFitter(smooth_window=smooth_window, remove_outliers=remove_outliers)
+    amp = fitter.prepare(stack.amp[:, mask])
+    m = peak_metrics(stack.freq[mask], amp)
+    return pd.DataFrame({
+        'Temperature_K': stack.temperatures,
+        'Filename':      stack.filenames,
+        'Peak_Freq_THz': m['peak_freq'],
+        'Linear_Depth':  m['depth'],
+        'FWHM_THz':      m['fwhm'],
+        'Area':          m['area'],
+    }, columns=PREVIEW_COLUMNS)
@@ -0,0 +1,197 @@
+"""
+preprocess.py — shared outlier repair and smoothing of amplitude stacks.
+
+Fano fitting, auto-ROI detection and mode-grouping dip search all clean
+spectra the same way: isolated spikes are repaired from their neighbours,
+then the curve is Savitzky–Golay smoothed. Here both steps run on a 2-D
+stack of spectra at once (``savgol_filter(axis=-1)``), and the results are
+cached per spectrum under ``(data digest, window, threshold)``, so moving
+an ROI or range slider never repeats them, and every consumer reuses what
+another has already computed.
+"""
+import threading
+from collections import OrderedDict
+import numpy as np
+from scipy.signal import savgol_filter
+
+from modules.digest import content_digest
+from modules.logger import get_logger
+
+log = get_logger("thz.preprocess")
+
+OUTLIER_THRESHOLD = 5.0
+POLYORDER = 3
+
+
+# ── public ──────────────────────────────────────────────────────────────────
+def repair_outliers(block, thr=OUTLIER_THRESHOLD):
+    """Replace spikes in every row of ``block``; returns a new float64 array.
+
+    A point is flagged when its step to the next point exceeds ``thr`` times
+    the row's median step, and is replaced by the mean of its left
+    neighbour (already repaired, if it was flagged too) and its original
+    right neighbour. Runs of flagged points are walked one position per
+    iteration across all rows at once.
+    """
+    out = np.array(block, dtype=float, ndmin=2)
+    n = out.shape[-1]
+    if n < 3:
+        return out
+    step = np.abs(np.diff(out, axis=-1))
+    todo = np.zeros(out.shape, dtype=bool)
+    todo[:, 1:-1] = (step > np.median(step, axis=-1, keepdims=True) * thr)[:, 1:]
+    while todo.any():
+        # Leftmost pending point of every run: its left neighbour is final
+        head = todo.copy()
+        head[:, 1:] &= ~todo[:, :-1]
+        r, c = np.nonzero(head)
+        out[r, c] = (out[r, c - 1] + out[r, c + 1]) / 2.0
+        todo &= ~head
+    return out
+
+
+def smooth_rows(block, window, polyorder=POLYORDER, moving_average=False):
+    """Savitzky–Golay smooth each row of a finite 2-D block, in one call.
+
+    Even windows are widened by one. Windows too short for ``polyorder``
+    leave the block unchanged, as the original fitting did when
+    ``savgol_filter`` refused them; with ``moving_average`` (dip search)
+    they fall back to a centred moving average instead. Rows not longer
+    than the window are returned unchanged.
+    """
+    block = np.asarray(block, dtype=float)
+    w = window if window % 2 == 1 else window + 1
+    if w <= 1 or block.shape[-1] <= w:
+        return block
+    if w > polyorder:
+        return savgol_filter(block, w, polyorder, axis=-1)
+    if not moving_average:
+        return block
+    # Centred moving average, edges filled from the nearest full window
+    c = np.cumsum(np.pad(block, ((0, 0), (1, 0))), axis=-1)
+    core = (c[:, w:] - c[:, :-w]) / w
+    lead = (w - 1) // 2
+    return np.concatenate([np.repeat(core[:, :1], lead, axis=1), core,
+                           np.repeat(core[:, -1:], block.shape[1] - core.shape[1] - lead,
+                                     axis=1)], axis=1)
+
+
+def resmooth_slice(shared, raw, repaired, window, polyorder=POLYORDER):
+    """``smooth_rows`` of one repaired slice, reusing the smoothed whole spectrum.
+
+    ``shared`` is the smoothed whole spectrum on the slice, ``raw`` the
+    slice before and ``repaired`` after its outlier repair. Savitzky–Golay
+    is linear and local, so away from the slice ends the result is
+    ``shared`` plus the smoothed repair correction; only the ``window // 2``
+    points at each end, fitted from the slice's own end window, are
+    recomputed. Equal to ``smooth_rows(repaired)`` up to rounding.
+    """
+    w = window if window % 2 == 1 else window + 1
+    repaired = np.asarray(repaired, dtype=float)
+    if w <= max(1, polyorder) or len(repaired) <= w:
+        return smooth_rows(repaired[None], window, polyorder)[0]
+    h = w // 2
+    out = np.array(shared, dtype=float)
+    delta = repaired - raw
+    if delta.any():
+        out += savgol_filter(delta, w, polyorder)
+    out[:h] = savgol_filter(repaired[:w], w, polyorder)[:h]
+    out[-h:] = savgol_filter(repaired[-w:], w, polyorder)[-h:]
+    return out
+
+
+class Preprocessor:
+    """Bounded cache of preprocessed spectra, shared by every consumer."""
+
+    def __init__(self, max_rows=4096):
+        self.max_rows = max_rows
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def rows(self, rows, window, thr=OUTLIER_THRESHOLD, moving_average=False):
+        """Outlier-repaired (``thr`` not None) and smoothed copies of ``rows``.
+
+        ``rows`` is a 2-D array or a list of 1-D amplitude arrays (lengths
+        may differ). Returns read-only float64 arrays in the same layout.
+        Rows with NaN gaps are processed over their finite stretch only.
+        ``moving_average`` is passed on to ``smooth_rows``.
+        """
+        as_block = isinstance(rows, np.ndarray) and rows.ndim == 2
+        rows = [np.asarray(r, dtype=float) for r in rows]
+        keys = [(content_digest(r.tobytes()), window, thr, moving_average) for r in rows]
+        out = [None] * len(rows)
+
+        with self._lock:
+            for i, k in enumerate(keys):
+                hit = self._cache.get(k)
+                if hit is not None:
+                    self._cache.move_to_end(k)
+                    out[i] = hit
+        missing = [i for i, o in enumerate(out) if o is None]
+        self.hits += len(rows) - len(missing)
+        self.misses += len(missing)
+
+        # Batch the misses by length: one 2-D pass per distinct length
+        by_len = {}
+        for i in missing:
+            by_len.setdefault(len(rows[i]), []).append(i)
+        for idx in by_len.values():
+            done = _process(np.stack([rows[i] for i in idx]), window, thr, moving_average)
+            done.flags.writeable = False
+            for j, i in enumerate(idx):
+                out[i] = done[j]
+        if missing:
+            with self._lock:
+                for i in missing:
+                    self._cache[keys[i]] = out[i]
+                while len(self._cache) > self.max_rows:
+                    self._cache.popitem(last=False)
+
+        if as_block:
+            block = np.stack(out) if out else np.empty((0, 0))
+            block.flags.writeable = False
+            return block
+        return out
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def __len__(self):
+        return len(self._cache)
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_preprocessor():
+    """Process-wide Preprocessor used by fitting, ROI detection and dip search."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = Preprocessor()
+        return _shared
+
+
+# ── private ─────────────────────────────────────────────────────────────────
+def _process(block, window, thr, moving_average):
+    """Repair then smooth a same-length block; NaN rows use their finite stretch."""
+    full = np.isfinite(block).all(axis=1)
+    out = np.array(block)
+    if full.any():
+        sub = block[full]
+        if thr is not None:
+            sub = repair_outliers(sub, thr)
+        out[full] = smooth_rows(sub, window, moving_average=moving_average)
+    for row in np.flatnonzero(~full):
+        ok = np.flatnonzero(np.isfinite(block[row]))
+        if len(ok) < 3:
+            continue
+        sl = slice(ok[0], ok[-1] + 1)
+        seg = block[row:row + 1, sl]
+        if thr is not None:
+            seg = repair_outliers(seg, thr)
+        out[row, sl] = smooth_rows(seg, window, moving_average=moving_average)[0]
+    return out
@@ -0,0 +1,190 @@
+"""
+scan_catalog.py — SQLite catalogue of ingested scans.
+
+One row per scan with its header metadata (sample, temperature, start
+position), point count, frequency span and simple signal-to-noise figures,
+written once at ingest time. Queries such as "all TNS 3 scans between
+100 K and 200 K" then run against indexed columns instead of re-parsing
+every file. Together with the spectrum cache the catalogue also lets a
+selection be reopened without uploading the files again.
+"""
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+from modules.logger import get_logger
+
+log = get_logger("thz.catalog")
+
+CATALOG_PATH = os.path.join("cache", "catalog.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    path         TEXT NOT NULL,
+    digest       TEXT NOT NULL,
+    origin       TEXT,
+    sample       TEXT,
+    temperature  REAL,
+    start_pos    REAL,
+    n_points     INTEGER,
+    freq_min     REAL,
+    freq_max     REAL,
+    snr_td       REAL,
+    dyn_range_db REAL,
+    ingested_at  REAL,
+    PRIMARY KEY (path, digest)
+);
+CREATE INDEX IF NOT EXISTS idx_scans_temperature ON scans (temperature);
+CREATE INDEX IF NOT EXISTS idx_scans_sample_temp ON scans (sample, temperature);
+CREATE INDEX IF NOT EXISTS idx_scans_digest      ON scans (digest);
+"""
+
+_COLUMNS = ('path', 'digest', 'origin', 'sample', 'temperature', 'start_pos',
+            'n_points', 'freq_min', 'freq_max', 'snr_td', 'dyn_range_db',
+            'ingested_at')
+
+
+class ScanCatalog:
+    def __init__(self, db_path=CATALOG_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._ready = False
+
+    # ── public ──────────────────────────────────────────────────────────────
+    def add_many(self, entries):
+        """Insert or refresh scans; ``entries`` are ``(path, digest, origin, sample, rec)``."""
+        rows = [self._row(*e) for e in entries]
+        if not rows:
+            return 0
+        marks = ", ".join("?" * len(_COLUMNS))
+        try:
+            con = self._connect()
+        except sqlite3.Error as e:
+            log.warning(f"Scan catalogue unavailable: {e}")
+            return 0
+        try:
+            with con:                      # commits, or rolls back on error
+                con.executemany(
+                    f"INSERT OR REPLACE INTO scans ({', '.join(_COLUMNS)}) "
+                    f"VALUES ({marks})", rows)
+        except sqlite3.Error as e:
+            log.warning(f"Could not update scan catalogue: {e}")
+            return 0
+        finally:
+            con.close()
+        return len(rows)
+
+    def query(self, t_min=None, t_max=None, sample=None, origin=None, limit=None):
+        """Catalogued scans matching the filters, ordered by temperature."""
+        where, args = [], []
+        if sample:
+            where.append("sample = ?"); args.append(sample)
+        if t_min is not None:
+            where.append("temperature >= ?"); args.append(float(t_min))
+        if t_max is not None:
+            where.append("temperature <= ?"); args.append(float(t_max))
+        if origin:
+            where.append("origin = ?"); args.append(origin)
+        sql = f"SELECT {', '.join(_COLUMNS)} FROM scans"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY temperature, path"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return self._fetch(sql, args)
+
+    def samples(self):
+        """Distinct sample names, most scans first."""
+        rows = self._fetch("SELECT sample, COUNT(*) AS n FROM scans "
+                           "GROUP BY sample ORDER BY n DESC, sample")
+        return [r['sample'] for r in rows if r['sample']]
+
+    def temperature_span(self):
+        """``(lo, hi, n)``: span of the known temperatures and the total scan count.
+
+        Scans without a temperature (-1) count towards ``n`` but not the span.
+        """
+        rows = self._fetch("SELECT MIN(CASE WHEN temperature >= 0 THEN temperature END) AS lo, "
+                           "MAX(CASE WHEN temperature >= 0 THEN temperature END) AS hi, "
+                           "COUNT(*) AS n FROM scans")
+        r = rows[0] if rows else {'lo': None, 'hi': None, 'n': 0}
+        return r['lo'], r['hi'], r['n']
+
+    def __len__(self):
+        rows = self._fetch("SELECT COUNT(*) AS n FROM scans")
+        return rows[0]['n'] if rows else 0
+
+    # ── private ─────────────────────────────────────────────────────────────
+    def _connect(self):
+        with self._lock:
+            if not self._ready:
+                os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+                con = sqlite3.connect(self.db_path)
+                try:
+                    con.executescript(_SCHEMA)
+                finally:
+                    con.close()
+                self._ready = True
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def _fetch(self, sql, args=()):
+        try:
+            con = self._connect()
+        except sqlite3.Error as e:
+            log.warning(f"Scan catalogue unavailable: {e}")
+            return []
+        try:
+            con.row_factory = sqlite3.Row
+            return [dict(r) for r in con.execute(sql, args)]
+        except sqlite3.Error as e:
+            log.warning(f"Scan catalogue query failed: {e}")
+            return []
+        finally:
+            con.close()
+
+    @staticmethod
+    def _row(path, digest, origin, sample, rec):
+        freq = np.asarray(rec['freq'], dtype=float)
+        snr_td, dyn_db = _snr_metrics(rec)
+        return (path, digest, origin, sample, float(rec['temperature']),
+                float(rec.get('start_pos', 0.0)), int(len(freq)),
+                float(freq.min()) if len(freq) else None,
+                float(freq.max()) if len(freq) else None,
+                snr_td, dyn_db, time.time())
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_catalog():
+    """Process-wide ScanCatalog used by the loader and the app."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ScanCatalog()
+        return _shared
+
+
+def _snr_metrics(rec):
+    """Time-domain peak-to-noise ratio and spectral dynamic range (dB).
+
+    Noise is the standard deviation of the first tenth of the time trace
+    (ahead of the pulse); the spectral floor is the median amplitude of
+    the top tenth of the frequency range.
+    """
+    snr_td = dyn_db = None
+    E = np.asarray(rec.get('E_field', np.array([])), dtype=float)
+    if len(E) >= 20:
+        noise = float(np.std(E[:len(E) // 10]))
+        if noise > 0:
+            snr_td = float(np.max(np.abs(E)) / noise)
+    amp = np.asarray(rec.get('amp', np.array([])), dtype=float)
+    amp = amp[np.isfinite(amp) & (amp > 0)]
+    if len(amp) >= 20:
+        floor = float(np.median(amp[-(len(amp) // 10):]))
+        if floor > 0:
+            dyn_db = float(20 * np.log10(amp.max() / floor))
+    return snr_td, dyn_db
@@ -4,6 +4,10 @@ import datetime
 import numpy as np
 import pandas as pd
 
+from modules.logger import get_logger
+
+log = get_logger("thz.session")
+
 SESSION_DIR = "sessions"
 
 class NumpyEncoder(json.JSONEncoder):
@@ -37,14 +41,26 @@ class SessionManager:
         # We don't need to save raw 'files' if we save 'averaged_files', but let's save what we can
         clean_state = {}
         for k, v in state_dict.items():
+            # Underscore keys are internal caches (memos, stacks, finders)
+            if str(k).startswith('_'):
+                log.debug(f"Workspace save: skipping internal key {k!r}")
+                continue
             if k in ['files', 'averaged_files'] and v:
                 # Store lightweight metadata instead of all raw sweeps
-                clean_state[k] = [{'filename': d['filename'], 'temperature': d['temperature']} for d in v]
-            else:
-                clean_state[k] = v
-                
+                v = [{'filename': d['filename'], 'temperature': d['temperature']} for d in v]
+            try:
+                json.dumps(v, cls=NumpyEncoder)
+            except (TypeError, ValueError) as e:
+                # Not representable in JSON (objects, tuple keys, …)
+                log.warning(f"Workspace save: skipping {k!r} "
+                            f"({type(v).__name__} not JSON-encodable: {e})")
+                continue
+            clean_state[k] = v
+
+        # Encode fully before touching the file, so a failure leaves no partial JSON
+        text = json.dumps(clean_state, cls=NumpyEncoder, indent=2)
         with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(clean_state, f, cls=NumpyEncoder, indent=2)
+            f.write(text)
             
         # Generate Markdown Report
         md_path = os.path.join(run_dir, "report.md")
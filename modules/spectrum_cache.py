@@ -0,0 +1,169 @@
+"""
+spectrum_cache.py — persistent on-disk cache of parsed spectra.
+
+One uncompressed .npz file per scan, named after the digest of the raw
+upload bytes. Entries are reloaded as read-only memory maps, so a warm
+restart skips text parsing entirely. The cache is capped in size and
+evicts the least recently used entries first.
+
+The cache doubles as the storage backend for loaded spectra: ``put``
+hands back memory-mapped views of what it wrote, so session records never
+own a heap copy of the arrays. With ``dtype=np.float32`` the arrays are
+stored in single precision, halving disk and page-cache footprint;
+analysis code upcasts to float64 before computing (see bench_float32.py
+for the accuracy check against float64 storage).
+"""
+import os
+import struct
+import zipfile
+import numpy as np
+
+from modules.logger import get_logger
+from modules.spectrum_record import SpectrumRecord
+
+log = get_logger("thz.cache")
+
+CACHE_DIR = os.path.join("cache", "spectra")
+
+# freq / amp / amp_db are stored together as the rows of one (3, n) 'fd' block
+_ARRAY_KEYS  = ('time', 'E_field', 'fd')
+_SCALAR_KEYS = ('temperature', 'start_pos')
+
+
+class SpectrumCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=1024 * 1024 ** 2,
+                 dtype=np.float64):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.dtype     = np.dtype(dtype)
+
+    # ── public ──────────────────────────────────────────────────────────────
+    def get(self, digest, filename):
+        """Return the cached SpectrumRecord for ``digest`` or ``None``."""
+        path = self._path(digest)
+        if not os.path.exists(path):
+            return None
+        try:
+            arrays = _mmap_npz(path)
+            rec = SpectrumRecord(filename, float(arrays['temperature']),
+                                 arrays['fd'],
+                                 time=arrays['time'], E_field=arrays['E_field'],
+                                 start_pos=float(arrays['start_pos']))
+        except Exception as e:
+            log.warning(f"Dropping unreadable cache entry {digest}: {e}")
+            self._remove(path)
+            return None
+        # Touch so eviction sees this entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return rec
+
+    def put(self, digest, rec):
+        """Store a parsed spectrum under ``digest`` and enforce the size cap.
+
+        Returns the stored entry re-opened as a memory-mapped SpectrumRecord,
+        or ``None`` if the entry could not be written.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(digest)
+        tmp  = path + f".{os.getpid()}.tmp"
+        fd = np.vstack([rec['freq'], rec['amp'], rec.get('amp_db', rec['amp'])])
+        payload = {
+            'time':    np.ascontiguousarray(rec['time'], dtype=self.dtype),
+            'E_field': np.ascontiguousarray(rec['E_field'], dtype=self.dtype),
+            'fd':      np.ascontiguousarray(fd, dtype=self.dtype),
+        }
+        for k in _SCALAR_KEYS:
+            payload[k] = np.array(float(rec.get(k, 0.0)))
+        try:
+            with open(tmp, 'wb') as fh:
+                np.savez(fh, **payload)
+            os.replace(tmp, path)
+        except OSError as e:
+            log.warning(f"Could not write cache entry {digest}: {e}")
+            self._remove(tmp)
+            return None
+        self.evict()
+        return self.get(digest, rec['filename'])
+
+    def evict(self):
+        """Delete least-recently-used entries until the cache fits ``max_bytes``."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.npz'):
+                continue
+            p = os.path.join(self.cache_dir, name)
+            try:
+                info = os.stat(p)
+            except OSError:
+                continue
+            entries.append((info.st_mtime, info.st_size, p))
+
+        total = sum(e[1] for e in entries)
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, p in entries:
+            if total <= self.max_bytes:
+                break
+            if self._remove(p):
+                total -= size
+                log.info(f"Evicted cached spectrum {os.path.basename(p)}")
+
+    def clear(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            self._remove(os.path.join(self.cache_dir, name))
+
+    # ── private ─────────────────────────────────────────────────────────────
+    def _path(self, digest):
+        # Single-precision entries live next to float64 ones under their own name
+        suffix = '' if self.dtype == np.float64 else f".{self.dtype.name}"
+        return os.path.join(self.cache_dir, f"{digest}{suffix}.npz")
+
+    @staticmethod
+    def _remove(path):
+        # A memory-mapped entry cannot be deleted on Windows while in use
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+
+def _mmap_npz(path):
+    """Memory-map every member of an uncompressed .npz archive.
+
+    ``np.load`` cannot memory-map archive members, but ``np.savez`` stores
+    them uncompressed, so each member's raw .npy payload sits at a fixed
+    offset inside the zip and can be mapped directly.
+    """
+    out = {}
+    with zipfile.ZipFile(path) as zf, open(path, 'rb') as fh:
+        for info in zf.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"member {info.filename} is compressed")
+            fh.seek(info.header_offset)
+            local = fh.read(30)
+            name_len, extra_len = struct.unpack('<HH', local[26:30])
+            fh.seek(info.header_offset + 30 + name_len + extra_len)
+
+            version = np.lib.format.read_magic(fh)
+            if version == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(fh)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(fh)
+            key = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+
+            count = int(np.prod(shape)) if shape else 1
+            if shape == () or count == 0:
+                buf = fh.read(count * dtype.itemsize)
+                out[key] = np.frombuffer(buf, dtype=dtype).reshape(shape)
+            else:
+                out[key] = np.memmap(path, dtype=dtype, mode='r',
+                                     offset=fh.tell(), shape=shape,
+                                     order='F' if fortran else 'C')
+    return out
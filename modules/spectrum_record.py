@@ -0,0 +1,148 @@
+"""
+spectrum_record.py — compact container for one loaded (or averaged) spectrum.
+
+The frequency-domain columns live in a single contiguous ``(3, n)`` array
+``fd`` whose rows are frequency, linear amplitude and dB amplitude.
+``freq``, ``amp`` and ``amp_db`` are views into it, so switching the
+amplitude column or cloning a record is O(1) and never copies data.
+Averaged records may also carry ``spread``, a matching ``(3, n)`` block of
+per-point scan count, linear standard deviation and dB standard deviation.
+
+Records keep the dict-style access the rest of the app was written
+against (``d['freq']``, ``d.get('amp_db')``, ``'time' in d``).
+"""
+import numpy as np
+
+_FREQ, _AMP, _AMP_DB = 0, 1, 2
+_AMP_ROWS = {'amp': _AMP, 'amp_db': _AMP_DB}
+_DERIVED = ('amp_std', 'n_used')
+
+
+class SpectrumRecord:
+    __slots__ = ('filename', 'temperature', 'start_pos', 'time', 'E_field',
+                 'fd', 'amp_row', 'n_averaged', 'source_files', 'origin',
+                 'spread')
+
+    _KEYS = ('filename', 'temperature', 'start_pos', 'time', 'E_field',
+             'freq', 'amp', 'amp_db', 'n_averaged', 'source_files', 'origin',
+             'amp_std', 'n_used')
+
+    def __init__(self, filename, temperature, fd, time=None, E_field=None,
+                 start_pos=0.0, n_averaged=None, source_files=None,
+                 amp_row=_AMP, origin=None, spread=None):
+        # origin: name of the upload the scan came from (an archive for
+        # archive members and split sweeps, else the file itself)
+        self.filename     = filename
+        self.origin       = origin if origin is not None else filename
+        self.temperature  = temperature
+        self.start_pos    = start_pos
+        self.time         = time
+        self.E_field      = E_field
+        self.fd           = fd
+        self.amp_row      = amp_row
+        self.n_averaged   = n_averaged
+        self.source_files = source_files
+        self.spread       = spread
+
+    @classmethod
+    def from_columns(cls, filename, temperature, freq, amp, amp_db=None,
+                     dtype=np.float64, **kw):
+        """Pack separate frequency-domain columns into one read-only block."""
+        freq = np.asarray(freq)
+        fd = np.empty((3, len(freq)), dtype=dtype)
+        fd[_FREQ] = freq
+        fd[_AMP] = amp
+        fd[_AMP_DB] = amp if amp_db is None else amp_db
+        fd.flags.writeable = False
+        return cls(filename, temperature, fd, **kw)
+
+    # ── frequency-domain views ──────────────────────────────────────────────
+    @property
+    def freq(self):
+        return self.fd[_FREQ]
+
+    @property
+    def amp(self):
+        return self.fd[self.amp_row]
+
+    @property
+    def amp_db(self):
+        return self.fd[_AMP_DB]
+
+    @property
+    def amp_std(self):
+        """Per-point standard deviation of ``amp`` across averaged scans."""
+        return None if self.spread is None else self.spread[self.amp_row]
+
+    @property
+    def n_used(self):
+        """Per-point number of scans that went into the average."""
+        return None if self.spread is None else self.spread[0]
+
+    # ── O(1) derivation ─────────────────────────────────────────────────────
+    def clone(self, **changes):
+        """Shallow copy sharing every array; ``changes`` override fields."""
+        out = SpectrumRecord.__new__(SpectrumRecord)
+        for name in self.__slots__:
+            setattr(out, name, changes.pop(name, getattr(self, name)))
+        if changes:
+            raise TypeError(f"Unknown SpectrumRecord fields: {sorted(changes)}")
+        return out
+
+    def with_amp(self, column):
+        """Clone whose ``amp`` is the 'amp' (linear) or 'amp_db' column."""
+        return self.clone(amp_row=_AMP_ROWS[column])
+
+    def sorted_by_freq(self):
+        """Return self if frequencies ascend, else a re-ordered copy."""
+        f = self.fd[_FREQ]
+        if len(f) < 2 or np.all(f[1:] >= f[:-1]):
+            return self
+        order = np.argsort(f)
+        fd = self.fd[:, order]
+        fd.flags.writeable = False
+        spread = None
+        if self.spread is not None:
+            spread = self.spread[:, order]
+            spread.flags.writeable = False
+        return self.clone(fd=fd, spread=spread)
+
+    # ── dict-style access ───────────────────────────────────────────────────
+    def __getitem__(self, key):
+        if key not in self._KEYS:
+            raise KeyError(key)
+        val = getattr(self, key)
+        if val is None:
+            raise KeyError(key)
+        return val
+
+    def __setitem__(self, key, value):
+        if key in ('freq', 'amp', 'amp_db'):
+            # Copy-on-write: replacing one column must not touch shared views
+            row = _FREQ if key == 'freq' else (self.amp_row if key == 'amp' else _AMP_DB)
+            fd = self.fd.copy()
+            fd[row] = value
+            fd.flags.writeable = False
+            self.fd = fd
+        elif key in _DERIVED:
+            raise KeyError(f"{key} is derived from 'spread'")
+        elif key in self._KEYS:
+            setattr(self, key, value)
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self._KEYS and getattr(self, key) is not None
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [k for k in self._KEYS if getattr(self, k) is not None]
+
+    def __repr__(self):
+        return (f"SpectrumRecord({self.filename!r}, T={self.temperature}, "
+                f"n_freq={self.fd.shape[1]})")
@@ -0,0 +1,197 @@
+"""
+spectrum_stack.py — dataset-level temperature × frequency matrix.
+
+All spectra of a dataset resampled onto one common frequency grid and held
+as a single ``(n_temperatures, n_freq)`` array, rows sorted by temperature.
+Smoothing, dip search and export then work on the whole matrix at once
+instead of looping over per-file records.
+
+Scans from the same instrument normally share their grid exactly; the stack
+then reuses it untouched. Otherwise every row is linearly interpolated onto
+a uniform grid spanning all scans, and points outside a scan's own range
+are NaN. ``provenance`` records which of the two happened and, per row,
+whether that spectrum was resampled; ``native`` keeps every row's own
+points for plots and exports that must not show interpolated data.
+"""
+import numpy as np
+
+from modules.digest import content_digest
+from modules.preprocess import shared_preprocessor
+
+
+class SpectrumStack:
+    def __init__(self, freq, amp, temperatures, filenames, resampled,
+                 coverage, sources, native=None):
+        self.freq         = freq           # (n_freq,)
+        self.amp          = amp            # (n_temps, n_freq), read-only
+        self.temperatures = temperatures   # (n_temps,)
+        self.filenames    = filenames      # (n_temps,) object array
+        self.resampled    = resampled      # (n_temps,) bool — row interpolated
+        self.coverage     = coverage       # (n_temps, 2) native freq span
+        self._sources     = sources        # records in input order
+        self._native      = native         # per row (freq, amp), own grid
+        self._row_keys    = None
+
+    @classmethod
+    def build(cls, records):
+        """Stack ``records`` (SpectrumRecords or spectrum dicts) by temperature."""
+        sources = tuple(records)
+        order = sorted(range(len(sources)),
+                       key=lambda i: sources[i]['temperature'])
+        cols = []
+        for i in order:
+            f = np.asarray(sources[i]['freq'], dtype=float)
+            a = np.asarray(sources[i]['amp'], dtype=float)
+            if len(f) > 1 and np.any(f[1:] < f[:-1]):
+                idx = np.argsort(f)
+                f, a = f[idx], a[idx]
+            cols.append((f, a))
+
+        grid = cls._common_grid([f for f, _ in cols])
+        n = len(cols)
+        amp = np.empty((n, len(grid)))
+        resampled = np.zeros(n, dtype=bool)
+        coverage = np.full((n, 2), np.nan)
+        for row, (f, a) in enumerate(cols):
+            if len(f):
+                coverage[row] = f[0], f[-1]
+            if len(f) == len(grid) and np.array_equal(f, grid):
+                amp[row] = a
+            elif len(f):
+                amp[row] = np.interp(grid, f, a, left=np.nan, right=np.nan)
+                resampled[row] = True
+            else:
+                amp[row] = np.nan
+        amp.flags.writeable = False
+        grid.flags.writeable = False
+
+        return cls(grid, amp,
+                   np.array([sources[i]['temperature'] for i in order], dtype=float),
+                   np.array([sources[i]['filename'] for i in order], dtype=object),
+                   resampled, coverage, sources, tuple(cols))
+
+    # ── public ──────────────────────────────────────────────────────────────
+    @property
+    def n_temps(self):
+        return self.amp.shape[0]
+
+    @property
+    def n_freq(self):
+        return self.amp.shape[1]
+
+    @property
+    def provenance(self):
+        """How the common grid was obtained, for logs and export headers."""
+        step = float(np.median(np.diff(self.freq))) if self.n_freq > 1 else 0.0
+        return {
+            'method':   'linear' if self.resampled.any() else 'shared grid',
+            'n_resampled': int(self.resampled.sum()),
+            'grid':     (float(self.freq[0]) if self.n_freq else np.nan,
+                         float(self.freq[-1]) if self.n_freq else np.nan,
+                         self.n_freq, step),
+        }
+
+    @property
+    def row_keys(self):
+        """Per-row content keys (grid digest, row digest) for result caches."""
+        if self._row_keys is None:
+            grid = content_digest(self.freq.tobytes())
+            self._row_keys = [(grid, content_digest(row.tobytes())) for row in self.amp]
+        return self._row_keys
+
+    def matches(self, records):
+        """True if ``records`` are exactly the spectra this stack was built from."""
+        if len(records) != len(self._sources):
+            return False
+        for a, b in zip(records, self._sources):
+            if a is b:
+                continue
+            # Cheap clones (SpectrumRecord.clone / with_amp) share their arrays
+            if (getattr(a, 'fd', None) is None or a.fd is not getattr(b, 'fd', None)
+                    or a.amp_row != b.amp_row
+                    or a.temperature != b.temperature
+                    or a.filename != b.filename):
+                return False
+        return True
+
+    def window(self, lo=None, hi=None):
+        """``(freq, amp)`` views restricted to ``lo ≤ f ≤ hi``."""
+        i0 = 0 if lo is None else int(np.searchsorted(self.freq, lo, side='left'))
+        i1 = self.n_freq if hi is None else int(np.searchsorted(self.freq, hi, side='right'))
+        return self.freq[i0:i1], self.amp[:, i0:i1]
+
+    def native(self, row, lo=None, hi=None):
+        """``(freq, amp)`` of ``row`` on its own grid (sorted, never interpolated)."""
+        f, a = self._native[row]
+        m = np.ones(len(f), dtype=bool)
+        if lo is not None:
+            m &= f >= lo
+        if hi is not None:
+            m &= f <= hi
+        return f[m], a[m]
+
+    def smoothed(self, window, lo=None, hi=None, moving_average=False):
+        """Savitzky–Golay smoothed ``(freq, amp)`` over ``[lo, hi]``, all rows at once.
+
+        Whole rows are smoothed through the shared preprocessing cache and
+        then windowed, so changing ``lo``/``hi`` costs no smoothing. Rows
+        with gaps (NaN outside their native range) are smoothed over their
+        finite stretch only. ``moving_average`` as in ``smooth_rows``.
+        """
+        freq, _ = self.window(lo, hi)
+        if not self.n_temps or not len(freq):
+            return self.window(lo, hi)
+        i0 = int(np.searchsorted(self.freq, freq[0], side='left'))
+        full = shared_preprocessor().rows(self.amp, window, thr=None,
+                                          moving_average=moving_average)
+        return freq, full[:, i0:i0 + len(freq)]
+
+    def to_frame(self, lo=None, hi=None, freq_col='Frequency_THz',
+                 label='{T:.0f}K', native=False, rows=None):
+        """Wide table: one frequency column plus one amplitude column per row.
+
+        ``rows`` selects stack rows (default all). With ``native`` and any
+        of them resampled, each row instead gets its own frequency column
+        (``freq_col`` + label) beside its amplitudes, holding the scan's own
+        points; shorter columns are padded with NaN.
+        """
+        import pandas as pd
+        rows = np.arange(self.n_temps) if rows is None else np.asarray(rows, dtype=int)
+        if native and self.resampled[rows].any():
+            parts = []
+            for i in rows:
+                f, a = self.native(i, lo, hi)
+                name = label.format(T=self.temperatures[i])
+                parts += [pd.Series(f, name=f"{freq_col} {name}"), pd.Series(a, name=name)]
+            return pd.concat(parts, axis=1)
+        freq, block = self.window(lo, hi)
+        cols = [label.format(T=self.temperatures[i]) for i in rows]
+        df = pd.DataFrame(block[rows].T, columns=cols)
+        df.insert(0, freq_col, freq)
+        return df
+
+    def __len__(self):
+        return self.n_temps
+
+    def __repr__(self):
+        p = self.provenance
+        return (f"SpectrumStack({self.n_temps} × {self.n_freq}, "
+                f"{p['method']}, {p['n_resampled']} resampled)")
+
+    # ── private ─────────────────────────────────────────────────────────────
+    @staticmethod
+    def _common_grid(freqs):
+        """Shared grid if every scan has the same one, else a uniform union grid."""
+        nonempty = [f for f in freqs if len(f)]
+        if not nonempty:
+            return np.array([])
+        f0 = nonempty[0]
+        if all(len(f) == len(f0) and np.array_equal(f, f0) for f in nonempty[1:]):
+            return f0.copy()
+        lo = min(f[0] for f in nonempty)
+        hi = max(f[-1] for f in nonempty)
+        steps = [np.median(np.diff(f)) for f in nonempty if len(f) > 1]
+        step = min(s for s in steps if s > 0) if any(s > 0 for s in steps) else 0.001
+        n_pts = max(2, int(round((hi - lo) / step)) + 1)
+        return np.linspace(lo, hi, n_pts)
+
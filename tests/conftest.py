@@ -0,0 +1,64 @@
+"""
+Shared fixtures: synthetic scans in the instrument's text format.
+
+Run the suite from the repository root with:  python -m pytest tests
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.data_loader import DataLoader        # noqa: E402
+from modules.spectrum_cache import SpectrumCache  # noqa: E402
+
+
+def scan_bytes(temperature, n_rows=600, seed=0, shift_ps=0.0, sample="TNS 3"):
+    """One scan with a Fano dip near 1 THz that deepens on cooling."""
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0.0, 60.0, n_rows)
+    E = (np.exp(-(t - 10.0 - shift_ps) ** 2 / 0.3) * np.cos(6 * (t - 10.0))
+         + 1e-3 * rng.standard_normal(n_rows))
+    f = np.linspace(0.0, 4.0, n_rows)
+    kappa = 0.02 + 0.08 * np.tanh(1.76 * np.sqrt(max(0.0, 330.0 / temperature - 1)))
+    term = 1 - kappa * np.exp(0.3j) / (-1j * (f - 1.02) + (0.05 + kappa) / 2)
+    amp = np.abs((1.0 - 0.1 * f) * np.abs(term) ** 2
+                 + 2e-3 * rng.standard_normal(n_rows)) + 1e-3
+    header = (f"Description: {sample} {temperature:.0f}K\n"
+              "Start Position 0\n"
+              + "".join(f"Meta{i}: -\n" for i in range(10))
+              + "Pos. [um]\tTime [ps]\tE [a.u.]\tFreq [THz]\tAmp\tAmp dB\n")
+    body = "\n".join("\t".join(f"{v:.8e}" for v in row)
+                     for row in np.column_stack([t * 150.0, t, E, f, amp,
+                                                 20 * np.log10(amp)]))
+    return (header + body + "\n").encode('utf-8')
+
+
+class Upload:
+    """Minimal stand-in for a Streamlit UploadedFile."""
+
+    def __init__(self, name, data):
+        self.name = name
+        self._data = data
+
+    def read(self):
+        return self._data
+
+    def getvalue(self):
+        return self._data
+
+
+@pytest.fixture
+def loader(tmp_path):
+    """DataLoader with a private disk cache and no catalogue."""
+    return DataLoader(disk_cache=SpectrumCache(str(tmp_path / "spectra")), catalog=False)
+
+
+@pytest.fixture
+def series(loader):
+    """Six loaded scans from 80 K to 300 K."""
+    temps = [80, 120, 160, 200, 240, 300]
+    return [loader.load_file(Upload(f"TNS3_{T}K.txt", scan_bytes(T, seed=i)))
+            for i, T in enumerate(temps)]
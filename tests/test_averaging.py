@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+
+from modules.averaging import (RunningStats, average_by_temperature,
+                               average_group, group_by_temperature)
+
+
+def _spectrum(name, T, freq, amp):
+    return {'filename': name, 'temperature': T, 'freq': freq, 'amp': amp,
+            'amp_db': 20 * np.log10(amp)}
+
+
+def _loop_average(files, tol=1.0):
+    """The original nested loop: first-fit grouping, per-member np.interp mean."""
+    groups = []
+    for d in sorted(files, key=lambda d: d['temperature']):
+        for g in groups:
+            if abs(d['temperature'] - g[0]) <= tol:
+                g[1].append(d)
+                break
+        else:
+            groups.append((d['temperature'], [d]))
+    out = []
+    for _, members in groups:
+        ref = members[0]
+        f_min = max(m['freq'].min() for m in members)
+        f_max = min(m['freq'].max() for m in members)
+        f_common = ref['freq'][(ref['freq'] >= f_min) & (ref['freq'] <= f_max)]
+        out.append((np.mean([m['temperature'] for m in members]), f_common,
+                    np.mean([np.interp(f_common, m['freq'], m['amp']) for m in members], axis=0),
+                    np.mean([np.interp(f_common, m['freq'], m['amp_db']) for m in members],
+                            axis=0)))
+    return out
+
+
+def _scans(jitter, seed=0):
+    rng = np.random.default_rng(seed)
+    files = []
+    for T in (10.0, 10.4, 10.9, 50.0, 50.2, 120.0):
+        for r in range(3):
+            lo = 0.1 + (rng.uniform(0, 0.01) if jitter else 0.0)
+            f = np.linspace(lo, 3.0 + lo, 400)
+            amp = 1.0 + 0.2 * np.sin(3 * f) + 0.01 * rng.standard_normal(400)
+            files.append(_spectrum(f"s_{T}_{r}", T + 0.01 * r, f, amp))
+    return files
+
+
+@pytest.mark.parametrize("jitter", [False, True], ids=["shared_grid", "jittered"])
+def test_mean_matches_original_loop(jitter):
+    files = _scans(jitter)
+    averaged, info = average_by_temperature(files)
+    expected = _loop_average(files)
+    assert len(averaged) == len(expected)
+    for rec, (T, f, amp, amp_db) in zip(averaged, expected):
+        assert rec['temperature'] == pytest.approx(T)
+        np.testing.assert_array_equal(rec['freq'], f)
+        np.testing.assert_allclose(rec['amp'], amp, rtol=1e-12)
+        np.testing.assert_allclose(rec['amp_db'], amp_db, rtol=1e-12)
+    assert sum(len(v) for v in info.values()) == len(files)
+
+
+def test_grouping_opens_at_coldest_unassigned_scan():
+    files = [_spectrum(f"s{i}", T, np.linspace(0, 1, 5), np.ones(5))
+             for i, T in enumerate([5.0, 3.5, 3.0, 4.1, 4.0])]
+    groups = group_by_temperature(files, tol=1.0)
+    assert [[m['filename'] for m in g] for _, g in groups] == [["s2", "s1", "s4"],
+                                                               ["s3", "s0"]]
+    assert [t for t, _ in groups] == [3.0, 4.1]
+
+
+def test_inputs_are_not_modified():
+    files = _scans(jitter=True)
+    # Descending frequency axis: the averager must sort a copy, not the input
+    files[0] = _spectrum("rev", files[0]['temperature'], files[0]['freq'][::-1].copy(),
+                         files[0]['amp'][::-1].copy())
+    before = [(d['freq'].copy(), d['amp'].copy()) for d in files]
+    average_by_temperature(files, method='sigma_clip')
+    for d, (f, a) in zip(files, before):
+        np.testing.assert_array_equal(d['freq'], f)
+        np.testing.assert_array_equal(d['amp'], a)
+
+
+@pytest.mark.parametrize("n", [3, 4, 5])
+def test_sigma_clip_drops_a_spike_in_a_small_group(n):
+    f = np.linspace(0.1, 3.0, 200)
+    rng = np.random.default_rng(n)
+    members = [_spectrum(f"s{i}", 80.0, f, 1.0 + 0.01 * rng.standard_normal(200))
+               for i in range(n)]
+    spiked = members[1]['amp'].copy()
+    spiked[100] = 50.0
+    members[1] = _spectrum("spiked", 80.0, f, spiked)
+
+    clipped = average_group(members, method='sigma_clip')
+    clean = np.mean([m['amp'][100] for k, m in enumerate(members) if k != 1])
+    assert clipped['amp'][100] == pytest.approx(clean)
+    assert clipped.n_used[100] == n - 1
+    assert average_group(members, method='mean')['amp'][100] > 10
+
+
+def test_db_view_averages_like_the_linear_view(series):
+    group = [s.clone(temperature=80.0) for s in series[:3]]
+    linear = average_group(group)
+    via_db = average_group([s.with_amp('amp_db') for s in group])
+    np.testing.assert_array_equal(via_db.fd, linear.fd)
+
+
+def test_running_stats_match_numpy():
+    rng = np.random.default_rng(1)
+    block = rng.standard_normal((2, 37, 50))
+    block[0, 3, 7] = np.nan
+    stats = RunningStats(50)
+    for i in range(0, 37, 8):
+        stats.add(block[:, i:i + 8])
+    # A NaN in either column drops that scan's point from both
+    ref = np.where(np.isfinite(block).all(axis=0), block, np.nan)
+    np.testing.assert_allclose(stats.mean, np.nanmean(ref, axis=1), rtol=1e-12)
+    np.testing.assert_allclose(stats.std, np.nanstd(ref, axis=1, ddof=1), rtol=1e-12)
+    assert stats.count[7] == 36 and stats.count[0] == 37
@@ -0,0 +1,71 @@
+import gzip
+import io
+import zipfile
+
+import numpy as np
+
+from conftest import Upload, scan_bytes
+
+
+def _zip(members):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return buf.getvalue()
+
+
+def test_plain_scan_round_trips(loader):
+    rec = loader.load_file(Upload("TNS3_80K.txt", scan_bytes(80)))
+    assert rec['temperature'] == 80.0
+    assert len(rec['time']) == 600
+    # The DC row (f = 0) is dropped from the frequency domain
+    assert len(rec['freq']) == len(rec['amp']) == 599 and rec['freq'][0] > 0
+    np.testing.assert_allclose(rec['amp_db'], 20 * np.log10(rec['amp']), atol=1e-6)
+
+
+def test_zip_members_load_in_archive_order(loader):
+    data = _zip({"run/TNS3_80K.txt": scan_bytes(80),
+                 "run/TNS3_120K.txt": scan_bytes(120, seed=1),
+                 "__MACOSX/run/._TNS3_80K.txt": b"\x00\x05junk",
+                 "run/.hidden.txt": b"not a scan",
+                 "run/notes.md": b"# notes"})
+    records, errors = loader.load_many([Upload("batch.zip", data)], workers=1)
+    assert errors == []
+    assert [r['filename'] for r in records] == ["batch.zip/run/TNS3_80K.txt",
+                                                "batch.zip/run/TNS3_120K.txt"]
+    assert [r['temperature'] for r in records] == [80.0, 120.0]
+    assert {r.origin for r in records} == {"batch.zip"}
+
+
+def test_gzip_scan_matches_plain_upload(loader):
+    plain = loader.load_file(Upload("TNS3_80K.txt", scan_bytes(80)))
+    records, errors = loader.load_many(
+        [Upload("TNS3_80K.txt.gz", gzip.compress(scan_bytes(80)))], workers=1)
+    assert errors == []
+    assert records[0]['filename'] == "TNS3_80K.txt"
+    np.testing.assert_array_equal(records[0].fd, plain.fd)
+
+
+def test_multi_sweep_file_is_split(loader):
+    data = scan_bytes(80) + scan_bytes(81, seed=1)
+    records, errors = loader.load_many([Upload("TNS3_multi.txt", data)], workers=1)
+    assert errors == []
+    assert [r['filename'] for r in records] == ["TNS3_multi_sweep1.txt",
+                                                "TNS3_multi_sweep2.txt"]
+    assert [r['temperature'] for r in records] == [80.0, 81.0]
+    single = loader.load_file(Upload("TNS3_81K.txt", scan_bytes(81, seed=1)))
+    np.testing.assert_array_equal(records[1].fd, single.fd)
+
+
+def test_bad_archives_are_reported_not_raised(loader):
+    good = Upload("TNS3_80K.txt", scan_bytes(80))
+    bad_zip = Upload("broken.zip", b"PK\x03\x04 definitely not a zip")
+    bad_gz = Upload("broken.txt.gz", b"\x1f\x8b\x08\x00 truncated")
+    truncated = gzip.compress(scan_bytes(120))
+    cut_gz = Upload("TNS3_120K.txt.gz", truncated[:len(truncated) // 2])
+
+    records, errors = loader.load_many([bad_zip, good, bad_gz, cut_gz], workers=1)
+    assert [r['filename'] for r in records] == ["TNS3_80K.txt"]
+    assert [e[1] for e in errors] == ["broken.zip", "broken.txt.gz", "TNS3_120K.txt.gz"]
+    assert all(e[2].startswith("Could not read archive") for e in errors)
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from modules import fano_kernel
+from modules.fano_kernel import FanoModel, bcs, depth_db, fano, fano_jac
+
+F = np.linspace(0.8, 1.3, 257)
+PARAMS = [
+    (1.02, 0.08, 0.05, 0.3, -0.1, 1.0),
+    (0.95, 0.30, 0.01, -2.5, 0.2, 0.7),
+    (1.10, 0.01, 0.20, 3.0, 0.0, 1.2),
+]
+
+
+def _complex_fano(f, fr, kappa, gamma, phi, k_b, b_b):
+    """The original complex-valued model."""
+    t = 1 - kappa * np.exp(1j * phi) / (-1j * (f - fr) + (gamma + kappa) / 2)
+    return (k_b * f + b_b) * np.abs(t) ** 2
+
+
+@pytest.mark.parametrize("p", PARAMS)
+def test_fano_matches_complex_model(p):
+    np.testing.assert_allclose(fano(F, *p), _complex_fano(F, *p), rtol=1e-13)
+
+
+@pytest.mark.parametrize("p", PARAMS)
+def test_jacobian_matches_central_differences(p):
+    jac = fano_jac(F, *p)
+    assert jac.shape == (len(F), 6)
+    for j in range(6):
+        h = 1e-6 * max(1.0, abs(p[j]))
+        up, dn = list(p), list(p)
+        up[j] += h
+        dn[j] -= h
+        fd = (fano(F, *up) - fano(F, *dn)) / (2 * h)
+        np.testing.assert_allclose(jac[:, j], fd, rtol=1e-6, atol=1e-6)
+
+
+def test_model_reuses_its_buffer_but_not_the_jacobian():
+    model = FanoModel(F)
+    a = model(F, *PARAMS[0])
+    b = model(F, *PARAMS[1])
+    assert a is b
+    np.testing.assert_allclose(b, _complex_fano(F, *PARAMS[1]), rtol=1e-13)
+    assert model.jac(F, *PARAMS[0]) is not model.jac(F, *PARAMS[0])
+
+
+@pytest.mark.skipif(not fano_kernel.HAVE_NUMBA, reason="Numba not installed")
+@pytest.mark.parametrize("p", PARAMS)
+def test_numpy_and_numba_paths_agree(p, monkeypatch):
+    compiled = fano(F, *p).copy(), fano_jac(F, *p)
+    monkeypatch.setattr(fano_kernel, "HAVE_NUMBA", False)
+    np.testing.assert_allclose(fano(F, *p), compiled[0], rtol=1e-13)
+    np.testing.assert_allclose(fano_jac(F, *p), compiled[1], rtol=1e-10, atol=1e-12)
+
+
+@pytest.mark.parametrize("p", PARAMS)
+def test_depth_is_transmission_at_resonance(p):
+    fr, kappa, gamma, phi = p[:4]
+    t2 = _complex_fano(np.array([fr]), fr, kappa, gamma, phi, 0.0, 1.0)[0]
+    assert depth_db(kappa, gamma, phi) == pytest.approx(10 * np.log10(t2), rel=1e-12)
+
+
+def test_bcs_is_zero_above_tc():
+    T = np.array([10.0, 100.0, 199.0, 200.0, 250.0])
+    expected = 2.0 * np.tanh(1.5 * np.sqrt(np.clip(200.0 / T - 1, 0, None)))
+    np.testing.assert_allclose(bcs(T, 2.0, 200.0, 1.5), expected, rtol=1e-14)
+    assert bcs(T, 2.0, 200.0, 1.5)[-2:].tolist() == [0.0, 0.0]
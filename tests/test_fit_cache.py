@@ -0,0 +1,121 @@
+import os
+
+import numpy as np
+import pytest
+
+from modules import fano_fitter
+from modules.fano_fitter import PARAM_KEYS, FanoFitter
+from modules.fit_cache import FitCache
+from modules.preprocess import Preprocessor
+
+ROI = (0.8, 1.3)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return FitCache(str(tmp_path / "fits"))
+
+
+def _fitter(cache, **kw):
+    return FanoFitter(preprocessor=Preprocessor(), cache=cache, **kw)
+
+
+def _same(a, b):
+    assert a.keys() == b.keys()
+    for k in a:
+        if isinstance(a[k], np.ndarray):
+            np.testing.assert_array_equal(a[k], b[k])
+        else:
+            assert a[k] == b[k], k
+
+
+def test_second_batch_is_read_back(cache, series):
+    cold, errors = _fitter(cache).fit_many(series, ROI, workers=1)
+    assert errors == {}
+    assert (cache.hits, cache.misses) == (0, len(series))
+
+    warm, _ = _fitter(cache).fit_many(series, ROI, workers=1)
+    assert (cache.hits, cache.misses) == (len(series), len(series))
+    for name in cold:
+        _same(cold[name], warm[name])
+
+
+def test_results_match_uncached_fits(cache, series):
+    cached, _ = _fitter(cache).fit_many(series[:2], ROI, workers=1)
+    plain = FanoFitter(preprocessor=Preprocessor())
+    for d in series[:2]:
+        _same(cached[d['filename']],
+              plain.fit(d['freq'], d['amp'], ROI, d['temperature'], d['filename']))
+
+
+def test_changed_spectrum_or_settings_miss(cache, series):
+    d = series[0]
+    fitter = _fitter(cache)
+    fitter.fit(d['freq'], d['amp'], ROI, d['temperature'], d['filename'])
+    assert cache.misses == 1
+
+    # Filename and temperature are not part of the key
+    res = fitter.fit(d['freq'], d['amp'], ROI, 42.0, "renamed.txt")
+    assert cache.hits == 1
+    assert (res['Temperature_K'], res['Filename']) == (42.0, "renamed.txt")
+
+    bumped = np.array(d['amp'])
+    bumped[300] *= 1.001
+    fitter.fit(d['freq'], bumped, ROI, d['temperature'], d['filename'])
+    fitter.fit(d['freq'], d['amp'], (0.8, 1.35), d['temperature'], d['filename'])
+    _fitter(cache, smooth_window=7).fit(d['freq'], d['amp'], ROI, d['temperature'],
+                                        d['filename'])
+    assert (cache.hits, cache.misses) == (1, 4)
+
+
+def test_cache_version_bump_invalidates(cache, series, monkeypatch):
+    d = series[0]
+    fitter = _fitter(cache)
+    key = fitter._cache_key(d['freq'], d['amp'], ROI)
+    fitter.fit(d['freq'], d['amp'], ROI, d['temperature'], d['filename'])
+    assert cache.get(key) is not None
+
+    monkeypatch.setattr(fano_fitter, "_CACHE_VERSION", fano_fitter._CACHE_VERSION + 1)
+    assert fitter._cache_key(d['freq'], d['amp'], ROI) != key
+    hits = cache.hits
+    fitter.fit(d['freq'], d['amp'], ROI, d['temperature'], d['filename'])
+    assert cache.hits == hits
+
+
+def test_warm_started_and_preprocessed_fits_bypass_the_cache(cache, series):
+    d = series[0]
+    fitter = _fitter(cache)
+    first = fitter.fit(d['freq'], d['amp'], ROI, d['temperature'], d['filename'])
+    p0 = [first[k] for k in PARAM_KEYS]
+    fitter.fit(d['freq'], d['amp'], ROI, d['temperature'], d['filename'], p0=p0)
+    stretch = fitter.prepare([fitter.roi_slice(d['freq'], d['amp'], ROI)])[0]
+    fitter.fit(d['freq'], stretch, ROI, d['temperature'], d['filename'], preprocessed=True)
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_unreadable_entry_is_dropped(cache):
+    assert cache.put("k", {'Peak_Freq_THz': 1.0, 'freq_roi': np.arange(3.0)})
+    path = os.path.join(cache.cache_dir, "k.npz")
+    with open(path, 'wb') as fh:
+        fh.write(b"not an npz")
+    assert cache.get("k") is None
+    assert not os.path.exists(path)
+
+
+def test_round_trip_is_exact(cache):
+    res = {'Peak_Freq_THz': 1.0 / 3.0, 'Filename': "a.txt", 'freq_roi': np.linspace(0, 1, 11)}
+    cache.put("k", res)
+    _same(cache.get("k"), res)
+
+
+def test_eviction_keeps_the_newest_entries(tmp_path):
+    entry = {'x': np.zeros(1000)}
+    one = FitCache(str(tmp_path / "probe"))
+    one.put("probe", entry)
+    size = os.path.getsize(os.path.join(one.cache_dir, "probe.npz"))
+
+    cache = FitCache(str(tmp_path / "fits"), max_bytes=int(2.5 * size))
+    for i in range(5):
+        cache.put(f"k{i}", entry)
+        os.utime(os.path.join(cache.cache_dir, f"k{i}.npz"), (i, i))
+    assert sorted(os.listdir(cache.cache_dir)) == ["k3.npz", "k4.npz"]
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+from scipy.signal import savgol_filter
+
+from modules.preprocess import Preprocessor, repair_outliers, resmooth_slice, smooth_rows
+
+
+def _loop_repair(data, thr=5.0):
+    """The original per-point repair loop."""
+    out = data.copy()
+    diff = np.abs(np.diff(out))
+    med = np.median(diff)
+    for idx in np.where(diff > med * thr)[0]:
+        if 0 < idx < len(out) - 1:
+            out[idx] = (out[idx - 1] + out[idx + 1]) / 2.0
+    return out
+
+
+def _noisy(n_rows, n, seed=0, spikes=6):
+    rng = np.random.default_rng(seed)
+    block = np.sin(np.linspace(0, 6, n))[None] + 0.01 * rng.standard_normal((n_rows, n))
+    for row in block:
+        at = rng.choice(np.arange(1, n - 1), spikes, replace=False)
+        row[at] += rng.choice([-1, 1], spikes) * rng.uniform(0.5, 2, spikes)
+        row[at[0] + 1] += 1.5          # a run of two flagged points
+    return block
+
+
+def test_repair_matches_original_loop():
+    block = _noisy(8, 301)
+    out = repair_outliers(block)
+    assert not np.shares_memory(out, block)
+    for row, fixed in zip(block, out):
+        np.testing.assert_array_equal(fixed, _loop_repair(row))
+
+
+@pytest.mark.parametrize("window", [1, 2, 3])
+def test_short_windows_leave_the_block_unchanged(window):
+    block = _noisy(3, 50)
+    np.testing.assert_array_equal(smooth_rows(block, window), block)
+
+
+def test_moving_average_is_opt_in():
+    block = _noisy(2, 50)
+    avg = smooth_rows(block, 3, moving_average=True)
+    np.testing.assert_allclose(avg[:, 1:-1], (block[:, :-2] + block[:, 1:-1] + block[:, 2:]) / 3)
+    np.testing.assert_array_equal(avg[:, 0], avg[:, 1])
+    np.testing.assert_array_equal(avg[:, -1], avg[:, -2])
+
+
+@pytest.mark.parametrize("window", [5, 6, 11])
+def test_smooth_rows_is_savgol_per_row(window):
+    block = _noisy(4, 80)
+    w = window | 1
+    expected = np.stack([savgol_filter(row, w, 3) for row in block])
+    np.testing.assert_allclose(smooth_rows(block, window), expected, rtol=1e-12, atol=1e-14)
+
+
+@pytest.mark.parametrize("window", [3, 5, 9])
+@pytest.mark.parametrize("sl", [slice(0, 40), slice(57, 140), slice(200, 299)])
+def test_resmooth_slice_matches_smoothing_the_slice(window, sl):
+    amp = _noisy(1, 299, seed=2)[0]
+    shared = smooth_rows(amp[None], window)[0]
+    raw = amp[sl]
+    rep = repair_outliers(raw)[0]
+    expected = smooth_rows(rep[None], window)[0]
+    np.testing.assert_allclose(resmooth_slice(shared[sl], raw, rep, window), expected,
+                               rtol=0, atol=1e-12)
+
+
+def test_preprocessor_caches_per_row_and_setting():
+    pre = Preprocessor()
+    rows = list(_noisy(3, 120)) + [np.linspace(0, 1, 40)]
+    first = pre.rows(rows, 5)
+    assert (pre.hits, pre.misses) == (0, 4)
+    again = pre.rows(rows[::-1], 5)
+    assert (pre.hits, pre.misses) == (4, 4)
+    assert all(a is b for a, b in zip(first, again[::-1]))
+    assert not first[0].flags.writeable
+    pre.rows(rows[:1], 5, thr=None)
+    pre.rows(rows[:1], 7)
+    assert pre.misses == 6
+
+
+def test_nan_gaps_are_processed_over_the_finite_stretch():
+    row = _noisy(1, 100, seed=3)[0]
+    gapped = np.concatenate([[np.nan] * 5, row, [np.nan] * 3])
+    out = Preprocessor().rows([gapped], 5)[0]
+    assert np.isnan(out[:5]).all() and np.isnan(out[-3:]).all()
+    expected = smooth_rows(repair_outliers(row), 5)[0]
+    np.testing.assert_allclose(out[5:-3], expected, rtol=1e-12, atol=1e-14)